@@ -0,0 +1,3 @@
+"""
+Local stand-in for the Discord gateway and REST API, used for end-to-end load tests.
+"""
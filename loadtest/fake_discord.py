@@ -0,0 +1,666 @@
+"""
+A fake Discord: just enough of the gateway and REST API for the bot to run against.
+The bot is pointed at it with the DISCORD_API_BASE and DISCORD_GATEWAY_URL environment variables.
+Every REST call is recorded, and replies to commands are matched back to the
+MESSAGE_CREATE that triggered them to measure command-to-reply latency.
+"""
+import asyncio
+import collections
+import datetime
+import itertools
+import json
+import re
+import time
+import typing as tp
+
+from aiohttp import web
+
+DISCORD_EPOCH = 1420070400000
+MANAGE_GUILD = 1 << 5
+ADMINISTRATOR = 1 << 3
+HEARTBEAT_INTERVAL = 41250  # ms, same as the real gateway
+LARGE_THRESHOLD = 250  # guilds with more members are "large": GUILD_CREATE leaves the members out
+CHUNK_SIZE = 1000  # members per GUILD_MEMBERS_CHUNK, same as the real gateway
+
+_snowflake_counter = itertools.count()
+
+
+def snowflake() -> int:
+    """
+    Generate a unique snowflake-looking id.
+    Args: None
+    Return value: id of type int
+    """
+    millis = int(time.time() * 1000) - DISCORD_EPOCH
+    return (millis << 22) | (next(_snowflake_counter) % (1 << 22))
+
+
+def iso_now() -> str:
+    """
+    Current time in the ISO 8601 format Discord uses.
+    Args: None
+    Return value: timestamp of type str
+    """
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def make_user(user_id: int, name: str, bot: bool = False) -> dict:
+    """
+    Build a user object.
+    Args: user id, username, whether the user is a bot
+    Return value: user payload of type dict
+    """
+    return {
+        "id": str(user_id),
+        "username": name,
+        "discriminator": f"{user_id % 10000:04d}",
+        "global_name": None,
+        "avatar": None,
+        "bot": bot,
+        "public_flags": 0,
+    }
+
+
+def json_response(data: tp.Any, status: int = 200) -> web.Response:
+    """
+    Build a JSON response. discord.py compares the content type verbatim, so no charset.
+    Args: JSON-serializable data, HTTP status
+    Return value: response
+    """
+    return web.Response(
+        body=json.dumps(data).encode(), status=status, headers={"Content-Type": "application/json"}
+    )
+
+
+class FakeGuild:
+    """
+    A guild with an admin, a set of voters and candidates, and custom emojis.
+    """
+
+    def __init__(self, name: str, voters: int, candidates: int, emojis: int, bot_user: dict):
+        """
+        Create the guild and all its members.
+        Args: guild name, number of voters, candidates and custom emojis, bot user payload
+        Return value: None
+        """
+        self.id = snowflake()
+        self.name = name
+        self.channel_id = snowflake()
+        self.manager_role_id = snowflake()
+        self.voter_role_id = snowflake()
+        self.reward_role_id = snowflake()
+        self.bot_role_id = snowflake()
+        self.roles = [
+            self._role(self.id, "@everyone", 0, 0),
+            self._role(self.manager_role_id, "Election managers", MANAGE_GUILD, 1),
+            self._role(self.voter_role_id, "Voters", 0, 2),
+            self._role(self.reward_role_id, "Moderators", 0, 3),
+            self._role(self.bot_role_id, "Bot", ADMINISTRATOR, 4),
+        ]
+        self.emojis = [
+            {
+                "id": str(snowflake()),
+                "name": f"vote{i}",
+                "roles": [],
+                "require_colons": True,
+                "managed": False,
+                "animated": False,
+                "available": True,
+            }
+            for i in range(emojis)
+        ]
+        self.members = {}  # dict: {user_id: member payload}
+        self.admin = self._add_member(f"admin-{name}", [self.manager_role_id, self.voter_role_id])
+        self.voters = [
+            self._add_member(f"voter-{name}-{i}", [self.voter_role_id]) for i in range(voters)
+        ]
+        self.candidates = [
+            self._add_member(f"candidate-{name}-{i}", [self.voter_role_id]) for i in range(candidates)
+        ]
+        self._add_member(bot_user["username"], [self.bot_role_id], user=bot_user)
+        self.election_id = None  # filled in by the scenarios
+        self.board_id = None
+        self.ballot = {}  # dict: {candidate_id: (board message id, emoji payload, or button custom_id on button boards)}
+        self.expected = {}  # dict: {candidate_id: expected votes}
+        self.expected_voters = 0  # distinct voters with a vote at the end
+
+    @staticmethod
+    def _role(role_id: int, name: str, permissions: int, position: int) -> dict:
+        """
+        Build a role object.
+        Args: role id, name, permission bits, position
+        Return value: role payload of type dict
+        """
+        return {
+            "id": str(role_id),
+            "name": name,
+            "permissions": str(permissions),
+            "permissions_new": str(permissions),  # what API v7 clients (discord.py 1.x) read
+            "position": position,
+            "color": 0,
+            "hoist": False,
+            "managed": False,
+            "mentionable": True,
+            "flags": 0,
+        }
+
+    def _add_member(self, name: str, roles: tp.List[int], user: tp.Optional[dict] = None) -> int:
+        """
+        Add a member to the guild.
+        Args: username, role ids, optional prebuilt user payload
+        Return value: user id of type int
+        """
+        user = user or make_user(snowflake(), name)
+        self.members[int(user["id"])] = {
+            "user": user,
+            "roles": [str(i) for i in roles],
+            "joined_at": iso_now(),
+            "deaf": False,
+            "mute": False,
+            "nick": None,
+            "flags": 0,
+        }
+        return int(user["id"])
+
+    def payload(self, with_members: bool = True, bot_id: tp.Optional[int] = None) -> dict:
+        """
+        Build the GUILD_CREATE (or GET /guilds/{id}) payload.
+        Large guilds only include the bot's own member, like the real gateway; the rest has to be chunked.
+        Args: whether to include the member list, the bot's user id
+        Return value: guild payload of type dict
+        """
+        large = len(self.members) > LARGE_THRESHOLD
+        data = {
+            "id": str(self.id),
+            "name": self.name,
+            "icon": None,
+            "owner_id": str(self.admin),
+            "region": "europe",
+            "afk_channel_id": None,
+            "afk_timeout": 300,
+            "verification_level": 0,
+            "default_message_notifications": 0,
+            "explicit_content_filter": 0,
+            "roles": self.roles,
+            "emojis": self.emojis,
+            "stickers": [],
+            "features": [],
+            "mfa_level": 0,
+            "system_channel_id": None,
+            "system_channel_flags": 0,
+            "premium_tier": 0,
+            "preferred_locale": "en-US",
+            "nsfw_level": 0,
+            "member_count": len(self.members),
+            "large": large,
+            "channels": [
+                {
+                    "id": str(self.channel_id),
+                    "type": 0,
+                    "guild_id": str(self.id),
+                    "name": "elections",
+                    "position": 0,
+                    "permission_overwrites": [],
+                    "nsfw": False,
+                    "parent_id": None,
+                    "topic": None,
+                    "rate_limit_per_user": 0,
+                    "last_message_id": None,
+                }
+            ],
+            "threads": [],
+            "voice_states": [],
+            "presences": [],
+            "stage_instances": [],
+            "guild_scheduled_events": [],
+            "joined_at": iso_now(),
+        }
+        if with_members:
+            data["members"] = [self.members[bot_id]] if large else list(self.members.values())
+        return data
+
+
+class FakeDiscord:
+    """
+    The fake gateway + REST server.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765):
+        """
+        Set up the server state.
+        Args: host and port to listen on
+        Return value: None
+        """
+        self.host = host
+        self.port = port
+        self.bot_user = make_user(snowflake(), "ElectionsBot", bot=True)
+        self.owner_user = make_user(snowflake(), "owner")
+        self.guilds = {}  # dict: {guild_id: FakeGuild}
+        self.messages = {}  # dict: {message_id: message payload}, only messages the bot sent
+        self.rest_calls = []  # list of (method, route, monotonic timestamp)
+        self.replies = []  # list of (replied-to message id, reply payload)
+        self.identified = asyncio.Event()
+        self.presence_updated = asyncio.Event()  # the bot changes presence in on_ready
+        self._pending = {}  # dict: {command message id: [send timestamp, future, replies expected, replies]}
+        self._interactions = {}  # dict: {interaction id: (send timestamp, future)}
+        self.gateway_ops = []  # list of op codes the bot sent
+        self._ws = None
+        self._sequence = 0
+        self._nick_waiters = {}  # dict: {guild_id: future}, on_guild_join ends with a nick change
+        self._runner = None
+        self.app = web.Application(client_max_size=64 * 1024 ** 2)
+        self.app.router.add_get("/gateway-ws", self._gateway)
+        self.app.router.add_route("*", r"/api/{version:v\d+}/{path:.*}", self._rest)
+
+    @property
+    def url(self) -> str:
+        """
+        REST base to export as DISCORD_API_BASE.
+        """
+        return f"http://{self.host}:{self.port}/api/v10"
+
+    @property
+    def gateway_url(self) -> str:
+        """
+        Gateway URL to export as DISCORD_GATEWAY_URL.
+        """
+        return f"ws://{self.host}:{self.port}/gateway-ws"
+
+    async def start(self) -> None:
+        """
+        Start listening.
+        Args: None
+        Return value: None
+        """
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        """
+        Close the gateway connection and stop listening.
+        Args: None
+        Return value: None
+        """
+        if self._ws is not None:
+            await self._ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # gateway
+
+    async def _gateway(self, request: web.Request) -> web.WebSocketResponse:
+        """
+        Serve the gateway websocket. Only one client (the bot) is expected.
+        """
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        self._ws = ws
+        await ws.send_json({"op": 10, "d": {"heartbeat_interval": HEARTBEAT_INTERVAL}})
+        async for msg in ws:
+            if msg.type != 1:  # aiohttp.WSMsgType.TEXT
+                continue
+            payload = json.loads(msg.data)
+            op, data = payload["op"], payload.get("d")
+            self.gateway_ops.append(op)
+            if op == 1:  # heartbeat
+                await ws.send_json({"op": 11})
+            elif op == 2:  # identify
+                preloaded = list(self.guilds.values())  # guilds the bot is in before it connects
+                await self.dispatch(
+                    "READY",
+                    {
+                        "v": 10,
+                        "user": self.bot_user,
+                        "guilds": [{"id": str(i.id), "unavailable": True} for i in preloaded],
+                        "session_id": "fake-session",
+                        "resume_gateway_url": self.gateway_url,
+                        "private_channels": [],
+                        "relationships": [],
+                        "application": {"id": self.bot_user["id"], "flags": 0},
+                        "shard": [0, 1],
+                    },
+                )
+                self.identified.set()
+                for guild in preloaded:
+                    await self.dispatch("GUILD_CREATE", dict(guild.payload(bot_id=int(self.bot_user["id"])), unavailable=False))
+            elif op == 6:  # resume
+                await self.dispatch("RESUMED", {})
+            elif op == 3:  # presence update
+                self.presence_updated.set()
+            elif op == 8:  # request guild members
+                guild = self.guilds[int(data["guild_id"])]
+                members = list(guild.members.values())
+                chunks = range(0, len(members), CHUNK_SIZE)
+                for index, start in enumerate(chunks):
+                    await self.dispatch(
+                        "GUILD_MEMBERS_CHUNK",
+                        {
+                            "guild_id": str(guild.id),
+                            "members": members[start:start + CHUNK_SIZE],
+                            "chunk_index": index,
+                            "chunk_count": len(chunks),
+                            "nonce": data.get("nonce"),
+                        },
+                    )
+        self._ws = None
+        return ws
+
+    async def dispatch(self, event: str, data: dict) -> None:
+        """
+        Send a dispatch (op 0) event to the bot.
+        Args: event name, event data
+        Return value: None
+        """
+        self._sequence += 1
+        await self._ws.send_str(json.dumps({"op": 0, "t": event, "s": self._sequence, "d": data}))
+
+    async def add_guild(self, guild: FakeGuild) -> None:
+        """
+        Make the bot join a guild and wait until on_guild_join has finished.
+        Args: guild
+        Return value: None
+        """
+        self.guilds[guild.id] = guild
+        waiter = asyncio.get_running_loop().create_future()
+        self._nick_waiters[guild.id] = waiter
+        await self.dispatch("GUILD_CREATE", guild.payload(bot_id=int(self.bot_user["id"])))
+        await waiter
+
+    async def send_command(
+        self,
+        guild: FakeGuild,
+        content: str,
+        replies: int = 1,
+        author: tp.Optional[int] = None,
+        timeout: float = 60,
+    ) -> dict:
+        """
+        Send a MESSAGE_CREATE and wait for the bot to reply to it.
+        Args: guild, message content, number of replies to wait for,
+        author id (the guild admin by default), seconds to wait for the replies
+        Return value: dict with the reply payloads and the latency of the first reply in seconds
+        Raises asyncio.TimeoutError if the bot does not reply in time.
+        """
+        author = author or guild.admin
+        member = guild.members[author]
+        message_id = snowflake()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = [time.perf_counter(), future, replies, []]
+        await self.dispatch(
+            "MESSAGE_CREATE",
+            {
+                "id": str(message_id),
+                "channel_id": str(guild.channel_id),
+                "guild_id": str(guild.id),
+                "author": member["user"],
+                "member": {k: v for k, v in member.items() if k != "user"},
+                "content": content,
+                "timestamp": iso_now(),
+                "edited_timestamp": None,
+                "tts": False,
+                "mention_everyone": False,
+                "mentions": [],
+                "mention_roles": [],
+                "attachments": [],
+                "embeds": [],
+                "pinned": False,
+                "type": 0,
+                "flags": 0,
+            },
+        )
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def react(self, guild: FakeGuild, message_id: int, user_id: int, emoji: dict, add: bool) -> None:
+        """
+        Send a MESSAGE_REACTION_ADD or MESSAGE_REACTION_REMOVE event.
+        Args: guild, message id, reacting user id, emoji payload, whether the reaction is added
+        Return value: None
+        """
+        data = {
+            "user_id": str(user_id),
+            "channel_id": str(guild.channel_id),
+            "message_id": str(message_id),
+            "guild_id": str(guild.id),
+            "emoji": {"id": emoji["id"], "name": emoji["name"], "animated": False},
+            "burst": False,
+            "type": 0,
+        }
+        if add:
+            data["member"] = guild.members[user_id]
+        await self.dispatch("MESSAGE_REACTION_ADD" if add else "MESSAGE_REACTION_REMOVE", data)
+
+    async def click(self, guild: FakeGuild, message_id: int, user_id: int, custom_id: str, timeout: float = 60) -> dict:
+        """
+        Send an INTERACTION_CREATE for a button click and wait for the bot to respond to it.
+        Args: guild, message id, clicking user id, button custom_id, seconds to wait for the response
+        Return value: dict with the response data and its latency in seconds
+        Raises asyncio.TimeoutError if the bot does not respond in time.
+        """
+        interaction_id = snowflake()
+        future = asyncio.get_running_loop().create_future()
+        self._interactions[interaction_id] = (time.perf_counter(), future)
+        await self.dispatch(
+            "INTERACTION_CREATE",
+            {
+                "id": str(interaction_id),
+                "application_id": self.bot_user["id"],
+                "type": 3,  # message component
+                "data": {"custom_id": custom_id, "component_type": 2},
+                "guild_id": str(guild.id),
+                "channel_id": str(guild.channel_id),
+                "channel": {"id": str(guild.channel_id), "type": 0},
+                "member": guild.members[user_id],
+                "message": self.messages[message_id],
+                "token": f"token-{interaction_id}",
+                "version": 1,
+                "app_permissions": "0",
+                "attachment_size_limit": 8 * 1024 ** 2,
+                "locale": "en-US",
+                "guild_locale": "en-US",
+                "entitlements": [],
+                "authorizing_integration_owners": {},
+            },
+        )
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._interactions.pop(interaction_id, None)
+
+    # REST
+
+    @staticmethod
+    def route_of(method: str, path: str) -> str:
+        """
+        Normalize a request path into a route template for counting.
+        Args: HTTP method, path after the API version
+        Return value: route of type str, e.g. "PUT /channels/{id}/pins/{id}"
+        """
+        path = re.sub(r"/reactions/[^/]+", "/reactions/{emoji}", path)
+        path = re.sub(r"\d{15,}", "{id}", path)
+        return f"{method} /{path}"
+
+    async def _rest(self, request: web.Request) -> web.Response:
+        """
+        Record a REST call and answer it.
+        """
+        method, path = request.method, request.match_info["path"]
+        self.rest_calls.append((method, self.route_of(method, path), time.monotonic()))
+        body = await self._read_body(request)
+        parts = path.split("/")
+        ok = web.Response(status=204)
+
+        if method == "GET" and path in ("gateway", "gateway/bot"):
+            return json_response(
+                {
+                    "url": self.gateway_url,
+                    "shards": 1,
+                    "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1},
+                }
+            )
+        if method == "GET" and path == "users/@me":
+            return json_response(self.bot_user)
+        if method == "GET" and path == "oauth2/applications/@me":
+            return json_response(
+                {
+                    "id": self.bot_user["id"],
+                    "name": self.bot_user["username"],
+                    "icon": None,
+                    "description": "",
+                    "rpc_origins": [],
+                    "bot_public": True,
+                    "bot_require_code_grant": False,
+                    "owner": self.owner_user,
+                    "summary": "",
+                    "verify_key": "",
+                    "team": None,
+                    "flags": 0,
+                }
+            )
+        if method == "POST" and parts[0] == "interactions" and len(parts) == 4 and parts[3] == "callback":
+            return self._interaction_callback(int(parts[1]), body)
+        if parts[0] == "channels" and len(parts) >= 3 and parts[2] == "messages":
+            return self._channel_messages(method, parts, body)
+        if parts[0] == "guilds" and len(parts) >= 2 and parts[1].isdigit():
+            guild = self.guilds.get(int(parts[1]))
+            if guild is None:
+                return self._not_found("Unknown Guild", 10004)
+            if method == "GET" and len(parts) == 2:
+                return json_response(guild.payload(with_members=False))
+            if len(parts) >= 4 and parts[2] == "members" and parts[3] == "@me":
+                waiter = self._nick_waiters.pop(guild.id, None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(None)
+                return json_response(guild.members[int(self.bot_user["id"])])
+            if method == "GET" and len(parts) == 4 and parts[2] == "members":
+                member = guild.members.get(int(parts[3]))
+                return json_response(member) if member else self._not_found("Unknown Member", 10007)
+            return ok
+        if method == "GET" and parts[0] == "users" and len(parts) == 2:
+            for guild in self.guilds.values():
+                if int(parts[1]) in guild.members:
+                    return json_response(guild.members[int(parts[1])]["user"])
+            return self._not_found("Unknown User", 10013)
+        return ok
+
+    def _channel_messages(self, method: str, parts: tp.List[str], body: dict) -> web.Response:
+        """
+        Handle /channels/{id}/messages/... routes.
+        """
+        channel_id = int(parts[1])
+        if method == "POST" and len(parts) == 3:
+            message = self._bot_message(channel_id, body)
+            reference = body.get("message_reference") or {}
+            replied_to = int(reference["message_id"]) if reference.get("message_id") else None
+            if replied_to is not None:
+                self.replies.append((replied_to, message))
+                pending = self._pending.get(replied_to)
+                if pending is not None:
+                    started, future, expected, received = pending
+                    received.append((time.perf_counter() - started, message))
+                    if len(received) >= expected:
+                        del self._pending[replied_to]
+                        future.set_result(
+                            {"replies": [i[1] for i in received], "latency": received[0][0]}
+                        )
+            return json_response(message)
+        message_id = int(parts[3]) if len(parts) >= 4 and parts[3].isdigit() else None
+        message = self.messages.get(message_id)
+        if len(parts) == 4:
+            if message is None:
+                return self._not_found("Unknown Message", 10008)
+            if method == "GET":
+                return json_response(message)
+            if method == "PATCH":
+                message.update({k: v for k, v in body.items() if k in ("content", "embeds", "components")})
+                if "embed" in body:
+                    message["embeds"] = [body["embed"]]
+                return json_response(message)
+            if method == "DELETE":
+                del self.messages[message_id]
+        return web.Response(status=204)
+
+    def _interaction_callback(self, interaction_id: int, body: dict) -> web.Response:
+        """
+        Handle an interaction response and hand it to whoever is waiting in click().
+        """
+        pending = self._interactions.pop(interaction_id, None)
+        if pending is not None and not pending[1].done():
+            started, future = pending
+            future.set_result({"data": body.get("data") or {}, "latency": time.perf_counter() - started})
+        ephemeral = bool((body.get("data") or {}).get("flags", 0) & 64)
+        return json_response(
+            {
+                "interaction": {
+                    "id": str(interaction_id),
+                    "type": 3,
+                    "response_message_id": str(snowflake()),
+                    "response_message_loading": False,
+                    "response_message_ephemeral": ephemeral,
+                }
+            }
+        )
+
+    def _bot_message(self, channel_id: int, body: dict) -> dict:
+        """
+        Store and return a message the bot just sent.
+        """
+        guild_id = next((g.id for g in self.guilds.values() if g.channel_id == channel_id), None)
+        embeds = body.get("embeds") or ([body["embed"]] if body.get("embed") else [])
+        message = {
+            "id": str(snowflake()),
+            "channel_id": str(channel_id),
+            "guild_id": str(guild_id) if guild_id else None,
+            "author": self.bot_user,
+            "content": body.get("content") or "",
+            "timestamp": iso_now(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": embeds,
+            "components": body.get("components") or [],
+            "pinned": False,
+            "type": 19 if body.get("message_reference") else 0,
+            "flags": 0,
+        }
+        self.messages[int(message["id"])] = message
+        return message
+
+    @staticmethod
+    async def _read_body(request: web.Request) -> dict:
+        """
+        Read a JSON or multipart (payload_json) request body.
+        """
+        if not request.can_read_body:
+            return {}
+        if request.content_type == "application/json":
+            return await request.json()
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == "payload_json":
+                    return json.loads(await part.text())
+        return {}
+
+    @staticmethod
+    def _not_found(message: str, code: int) -> web.Response:
+        """
+        Build a Discord-style 404 error.
+        """
+        return json_response({"message": message, "code": code}, status=404)
+
+    # reporting
+
+    def calls_since(self, since: float) -> tp.Counter:
+        """
+        Count REST calls by route since a point in time.
+        Args: monotonic timestamp
+        Return value: Counter of {route: calls}
+        """
+        return collections.Counter(route for _, route, at in self.rest_calls if at >= since)
@@ -0,0 +1,450 @@
+"""
+Scripted end-to-end scenarios against the fake Discord.
+Run with `python -m loadtest.scenarios` from the repository root; the bot is
+started as a subprocess pointed at the fake (use --no-spawn to run it yourself).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import typing as tp
+
+from loadtest.fake_discord import FakeDiscord, FakeGuild
+
+EMOJI_FIELD = re.compile(r"<a?:\w+:(\d+)>:(.*)")
+MAX_REACTIONS = 20  # candidates per board message, as in the Voting cog
+MAX_BUTTONS = 25
+
+
+class ScenarioReport:
+    """
+    Command-to-reply latencies and REST calls of one scenario.
+    """
+
+    def __init__(self, name: str, fake: FakeDiscord, timeout: float = 60):
+        """
+        Start measuring.
+        Args: scenario name, fake Discord, seconds to wait for each command's replies
+        Return value: None
+        """
+        self.name = name
+        self.fake = fake
+        self.timeout = timeout
+        self.latencies = []
+        self.timeouts = 0  # commands the bot never replied to
+        self.notes = {}
+        self._started = time.monotonic()
+        self.elapsed = None
+        self.rest_calls = None
+
+    def finish(self) -> None:
+        """
+        Stop measuring and collect the REST calls made since the start.
+        Args: None
+        Return value: None
+        """
+        self.elapsed = time.monotonic() - self._started
+        self.rest_calls = self.fake.calls_since(self._started)
+
+    def as_dict(self) -> dict:
+        """
+        Summarize the report.
+        Args: None
+        Return value: summary of type dict
+        """
+        latencies = self.latencies
+        summary = {
+            "scenario": self.name,
+            "elapsed_s": round(self.elapsed, 3),
+            "commands": len(latencies),
+            "timeouts": self.timeouts,
+            "rest_calls_total": sum(self.rest_calls.values()),
+            "rest_calls": dict(self.rest_calls.most_common()),
+        }
+        if latencies:
+            summary["latency_ms"] = percentiles(latencies)
+        summary.update(self.notes)
+        return summary
+
+
+def percentiles(latencies: tp.List[float]) -> dict:
+    """
+    Summarize latencies.
+    Args: latencies in seconds
+    Return value: dict with p50, p95 and max in milliseconds
+    """
+    latencies = sorted(latencies)
+    return {
+        "p50": round(statistics.median(latencies) * 1000, 1),
+        "p95": round(latencies[round((len(latencies) - 1) * 0.95)] * 1000, 1),
+        "max": round(latencies[-1] * 1000, 1),
+    }
+
+
+async def gather_limited(coroutines: tp.Iterable[tp.Awaitable], limit: int) -> list:
+    """
+    Await coroutines with at most `limit` running at once.
+    Args: coroutines, concurrency limit
+    Return value: results in order
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(i) for i in coroutines))
+
+
+async def command(report: ScenarioReport, guild: FakeGuild, content: str, replies: int = 1) -> dict:
+    """
+    Send a command, wait for its replies and record the latency.
+    Args: report, guild, command text, number of replies to wait for
+    Return value: reply data from FakeDiscord.send_command
+    """
+    try:
+        result = await report.fake.send_command(guild, content, replies=replies, timeout=report.timeout)
+    except asyncio.TimeoutError:
+        report.timeouts += 1
+        raise
+    report.latencies.append(result["latency"])
+    return result
+
+
+async def configure(fake: FakeDiscord, guilds: tp.List[FakeGuild], args) -> ScenarioReport:
+    """
+    Set reward roles and role weights in every guild.
+    """
+    report = ScenarioReport("configure", fake)
+
+    async def one(guild):
+        await command(report, guild, f"!set-reward-roles <@&{guild.reward_role_id}>")
+        await command(report, guild, f"!set-role-weights <@&{guild.voter_role_id}> 1")
+        if args.board_mode == "buttons":
+            await command(report, guild, "!set-board-mode buttons")
+
+    await gather_limited((one(g) for g in guilds), args.concurrency)
+    report.finish()
+    return report
+
+
+async def start_elections(fake: FakeDiscord, guilds: tp.List[FakeGuild], args) -> ScenarioReport:
+    """
+    Start an election with every candidate in every guild and remember the voting boards.
+    """
+    report = ScenarioReport("start-election", fake)
+
+    per_message = MAX_BUTTONS if args.board_mode == "buttons" else min(MAX_REACTIONS, args.emojis)
+    board_messages = -(-args.candidates // per_message)
+
+    async def one(guild):
+        mentions = " ".join(f"<@{i}>" for i in guild.candidates)
+        result = await command(report, guild, f"!start-election {mentions}", replies=1 + board_messages)
+        boards = [i for i in result["replies"] if i["embeds"]]
+        guild.election_id = int(boards[0]["embeds"][0]["title"].split("#")[1])
+        guild.board_id = int(boards[0]["id"])
+        names = {guild.members[i]["user"]["username"]: i for i in guild.candidates}
+        emojis = {int(e["id"]): e for e in guild.emojis}
+        for board in boards:
+            if board["components"]:  # button board
+                for row in board["components"]:
+                    for button in row["components"]:
+                        guild.ballot[int(button["custom_id"].split(":")[2])] = (int(board["id"]), button["custom_id"])
+                continue
+            for field in board["embeds"][0]["fields"]:
+                emoji_id, name = EMOJI_FIELD.match(field["value"]).groups()
+                guild.ballot[names[name]] = (int(board["id"]), emojis[int(emoji_id)])
+
+    await gather_limited((one(g) for g in guilds), args.start_concurrency)
+    report.finish()
+    return report
+
+
+async def reactions(fake: FakeDiscord, guilds: tp.List[FakeGuild], args) -> ScenarioReport:
+    """
+    Fire add/remove reactions (or button clicks) on the voting boards, interleaved across guilds,
+    then poll view-election-poll until the tallies match what the voters did.
+    """
+    report = ScenarioReport("reactions", fake)
+    rng = random.Random(args.seed)
+    per_guild = args.reactions // len(guilds)
+    plans = []
+    for guild in guilds:
+        state = set()  # set of (voter, candidate) reactions currently present
+        plan = []
+        for _ in range(per_guild):
+            key = (rng.choice(guild.voters), rng.choice(guild.candidates))
+            add = key not in state
+            state.symmetric_difference_update({key})
+            plan.append((guild, key[0], key[1], add))
+        guild.expected = {i: sum(1 for _, c in state if c == i) for i in guild.candidates}
+        guild.expected_voters = len({v for v, _ in state})
+        plans.append(plan)
+
+    dispatch_start = time.monotonic()
+    acks = []  # button boards only: click-to-response latencies
+    rejected = 0  # button boards only: clicks the bot turned down, e.g. for voting too fast
+    if args.board_mode == "buttons":
+        # a click is only counted if the bot says so, so every guild clicks through its plan in order
+        async def click_through(plan):
+            nonlocal rejected
+            state = set()
+            for guild, voter, candidate, _ in plan:
+                try:
+                    message_id, custom_id = guild.ballot[candidate]
+                    result = await fake.click(guild, message_id, voter, custom_id, timeout=report.timeout)
+                except asyncio.TimeoutError:
+                    report.timeouts += 1
+                    continue
+                acks.append(result["latency"])
+                if "too fast" in result["data"].get("content", ""):
+                    rejected += 1
+                else:
+                    state.symmetric_difference_update({(voter, candidate)})
+            guild = plan[0][0]
+            guild.expected = {i: sum(1 for _, c in state if c == i) for i in guild.candidates}
+            guild.expected_voters = len({v for v, _ in state})
+
+        await asyncio.gather(*(click_through(plan) for plan in plans if plan))
+    else:
+        for events in zip(*plans):
+            for guild, voter, candidate, add in events:
+                message_id, emoji = guild.ballot[candidate]
+                await fake.react(guild, message_id, voter, emoji, add)
+    dispatch_time = time.monotonic() - dispatch_start
+
+    async def converge(guild):
+        deadline = time.monotonic() + args.drain_timeout
+        while True:
+            try:
+                result = await command(report, guild, f"!view-election-poll {guild.election_id}")
+            except asyncio.TimeoutError:
+                return None
+            embeds = result["replies"][0]["embeds"]
+            names = {f"{u['user']['username']}#{u['user']['discriminator']}": i for i, u in guild.members.items()}
+            tally = {names[f["name"]]: int(f["value"]) for embed in embeds for f in embed["fields"]}
+            if tally == guild.expected:
+                return time.monotonic() - dispatch_start
+            if time.monotonic() > deadline:
+                return None
+            await asyncio.sleep(1)
+
+    converged = await gather_limited((converge(g) for g in guilds), args.concurrency)
+    report.finish()
+    report.notes = {
+        "reaction_events": per_guild * len(guilds),
+        "dispatch_s": round(dispatch_time, 3),
+        "events_per_s": round(per_guild * len(guilds) / dispatch_time, 1) if dispatch_time else None,
+        "guilds_converged": sum(1 for i in converged if i is not None),
+        "guilds_total": len(guilds),
+        "converged_after_s": round(max(i for i in converged if i is not None), 3) if any(converged) else None,
+    }
+    if acks:
+        report.notes["ack_ms"] = percentiles(acks)
+        report.notes["clicks_rejected"] = rejected
+    return report
+
+
+async def election_stats(fake: FakeDiscord, guilds: tp.List[FakeGuild], args) -> ScenarioReport:
+    """
+    Ask for every election's statistics and check the final turnout against the voters who voted.
+    """
+    report = ScenarioReport("election-stats", fake)
+
+    async def one(guild):
+        result = await command(report, guild, f"!election-stats {guild.election_id}")
+        embeds = result["replies"][0]["embeds"]
+        if not embeds:
+            return False
+        chart = embeds[0]["fields"][0]["value"].strip("`\n").splitlines()
+        return int(chart[-1].split()[-1]) == guild.expected_voters
+
+    correct = await gather_limited((one(g) for g in guilds), args.concurrency)
+    report.finish()
+    report.notes = {"turnout_correct": sum(correct), "guilds_total": len(guilds)}
+    return report
+
+
+async def read_burst(fake: FakeDiscord, guilds: tp.List[FakeGuild], args) -> ScenarioReport:
+    """
+    Have every guild's admin run the read-only commands many times at once, like members checking on a busy election.
+    """
+    report = ScenarioReport("read-burst", fake)
+    reads = ("!view-election-poll {}", "!view-current-elections", "!view-server-settings")
+    await gather_limited(
+        (command(report, g, read.format(g.election_id)) for g in guilds for read in reads for _ in range(args.read_burst)),
+        args.concurrency * len(reads) * args.read_burst,
+    )
+    report.finish()
+    return report
+
+
+async def leaderboards(fake: FakeDiscord, guilds: tp.List[FakeGuild], args) -> ScenarioReport:
+    """
+    Ask for every election's leaderboard and check the leader's vote count.
+    """
+    report = ScenarioReport("leaderboard", fake)
+
+    async def one(guild):
+        result = await command(report, guild, f"!leaderboard {guild.election_id} 5")
+        embeds = result["replies"][0]["embeds"]
+        if not embeds:
+            return False
+        leader = embeds[0]["fields"][0]["value"].splitlines()[0]
+        return int(leader.rsplit(": ", 1)[1]) == max(guild.expected.values())
+
+    correct = await gather_limited((one(g) for g in guilds), args.concurrency)
+    report.finish()
+    report.notes = {"leader_correct": sum(correct), "guilds_total": len(guilds)}
+    return report
+
+
+async def simulations(fake: FakeDiscord, guilds: tp.List[FakeGuild], args) -> ScenarioReport:
+    """
+    Simulate every election with a few pools and the leader's votes as the cutoff, and check the winner counts.
+    """
+    report = ScenarioReport("simulate-election", fake)
+    counts = re.compile(r"\*\*(\d+)\*\*: (\d+) winners")
+
+    async def one(guild):
+        top = max(guild.expected.values())
+        result = await command(report, guild, f"!simulate-election {guild.election_id} 1,2,3 {top}")
+        embeds = result["replies"][0]["embeds"]
+        if not embeds:
+            return False
+        pools, cutoffs = ([tuple(map(int, i)) for i in counts.findall(field["value"])] for field in embeds[0]["fields"])
+        expected_pools = [(i, min(i, len(guild.candidates))) for i in (1, 2, 3)]
+        return pools == expected_pools and cutoffs == [(top, sum(1 for i in guild.expected.values() if i >= top))]
+
+    correct = await gather_limited((one(g) for g in guilds), args.concurrency)
+    report.finish()
+    report.notes = {"simulation_correct": sum(correct), "guilds_total": len(guilds)}
+    return report
+
+
+async def finish_elections(fake: FakeDiscord, guilds: tp.List[FakeGuild], args) -> ScenarioReport:
+    """
+    Finish the election in every guild and check the winner (the default winners pool is one candidate).
+    """
+    report = ScenarioReport("finish-election", fake)
+
+    async def one(guild):
+        result = await command(report, guild, f"!finish-election {guild.election_id}")
+        winners = [int(i) for i in re.findall(r"<@!?(\d+)>", result["replies"][0]["content"])]
+        return len(winners) == 1 and guild.expected[winners[0]] == max(guild.expected.values())  # any of the tied
+
+    correct = await gather_limited((one(g) for g in guilds), args.concurrency)
+    report.finish()
+    report.notes = {"winner_correct": sum(correct), "guilds_total": len(guilds)}
+    return report
+
+
+SCENARIOS = (configure, start_elections, reactions, read_burst, election_stats, leaderboards, simulations, finish_elections)
+
+
+async def spawn_bot(fake: FakeDiscord, args) -> asyncio.subprocess.Process:
+    """
+    Start the bot as a subprocess pointed at the fake Discord.
+    Args: fake Discord, parsed arguments
+    Return value: the bot process
+    """
+    env = dict(os.environ)
+    env.update(
+        {
+            "BOT_TOKEN": "fake-token",
+            "DISCORD_API_BASE": fake.url,
+            "DISCORD_GATEWAY_URL": fake.gateway_url,
+            "DATABASE_URL": args.database_url,
+            "LEAN_MEMBER_CACHE": "1" if args.lean else "0",
+        }
+    )
+    log = open(args.bot_log, "wb")
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "main.py", env=env, stdout=log, stderr=asyncio.subprocess.STDOUT
+    )
+
+
+async def stop_bot(bot: asyncio.subprocess.Process) -> None:
+    """
+    Stop the bot subprocess, killing it if it does not exit in time.
+    Args: the bot process
+    Return value: None
+    """
+    if bot.returncode is None:
+        bot.terminate()
+        try:
+            await asyncio.wait_for(bot.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            bot.kill()
+            await bot.wait()
+
+
+async def run(args) -> tp.List[dict]:
+    """
+    Start the fake, the bot, join the guilds and run all scenarios.
+    Args: parsed arguments
+    Return value: list of scenario summaries
+    """
+    fake = FakeDiscord(port=args.port)
+    await fake.start()
+    bot = None if args.no_spawn else await spawn_bot(fake, args)
+    try:
+        await asyncio.wait_for(fake.identified.wait(), timeout=60)
+        await asyncio.wait_for(fake.presence_updated.wait(), timeout=60)
+        await asyncio.sleep(args.settle)  # on_ready initializes the database after changing presence
+        guilds = [
+            FakeGuild(f"guild{i}", args.voters, args.candidates, args.emojis, fake.bot_user)
+            for i in range(args.guilds)
+        ]
+        join = ScenarioReport("join", fake)
+        for guild in guilds:
+            await fake.add_guild(guild)
+        join.finish()
+        summaries = [join.as_dict()]
+        for scenario in SCENARIOS:
+            summaries.append((await scenario(fake, guilds, args)).as_dict())
+            print(json.dumps(summaries[-1]), flush=True)
+        return summaries
+    finally:
+        if bot is not None:
+            await stop_bot(bot)
+        await fake.stop()
+
+
+def main() -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--voters", type=int, default=50, help="voters per guild")
+    parser.add_argument("--candidates", type=int, default=10, help="candidates per guild")
+    parser.add_argument("--emojis", type=int, default=20, help="custom emojis per guild")
+    parser.add_argument("--reactions", type=int, default=50_000, help="reaction events across all guilds")
+    parser.add_argument("--concurrency", type=int, default=20, help="guilds driven at once")
+    parser.add_argument("--start-concurrency", type=int, default=20, help="elections started at once")
+    parser.add_argument("--read-burst", type=int, default=20, help="concurrent calls of each read command per guild")
+    parser.add_argument("--drain-timeout", type=float, default=300, help="seconds to wait for tallies to converge")
+    parser.add_argument("--settle", type=float, default=2, help="seconds to wait after on_ready")
+    parser.add_argument("--board-mode", choices=("reactions", "buttons"), default="reactions")
+    parser.add_argument("--lean", action="store_true", help="run the bot in the lean member-cache mode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", default="sqlite://:memory:")
+    parser.add_argument("--bot-log", default="loadtest_bot.log")
+    parser.add_argument("--no-spawn", action="store_true", help="do not start the bot, connect it yourself")
+    parser.add_argument("--json", help="write the summaries to this file")
+    args = parser.parse_args()
+    summaries = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summaries, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
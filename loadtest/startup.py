@@ -0,0 +1,100 @@
+"""
+Startup time and memory of the bot in the default and the lean member-cache mode.
+The bot is already in every guild when it connects, so it goes through the same
+READY -> GUILD_CREATE -> member chunking sequence as after a restart in production.
+Run with `python -m loadtest.startup` from the repository root (Linux only, memory is read from /proc).
+"""
+import argparse
+import asyncio
+import json
+import time
+import typing as tp
+
+from loadtest.fake_discord import FakeDiscord, FakeGuild
+from loadtest.scenarios import spawn_bot, stop_bot
+
+
+def memory_of(pid: int) -> tp.Dict[str, float]:
+    """
+    Read a process's resident memory.
+    Args: process id
+    Return value: dict with the current and peak resident set size in MiB
+    """
+    memory = {}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                memory[key] = round(int(value.split()[0]) / 1024, 1)
+    return {"rss_mib": memory["VmRSS"], "peak_rss_mib": memory["VmHWM"]}
+
+
+async def measure(args, lean: bool) -> dict:
+    """
+    Start the bot once against pre-joined guilds and measure it.
+    Args: parsed arguments, whether to use the lean member-cache mode
+    Return value: summary of type dict
+    """
+    fake = FakeDiscord(port=args.port)
+    await fake.start()
+    for i in range(args.guilds):
+        guild = FakeGuild(f"guild{i}", args.members, 0, 0, fake.bot_user)
+        fake.guilds[guild.id] = guild
+    args.lean = lean
+    started = time.monotonic()
+    bot = await spawn_bot(fake, args)
+    try:
+        await asyncio.wait_for(fake.identified.wait(), timeout=120)
+        identified = time.monotonic()
+        await asyncio.wait_for(fake.presence_updated.wait(), timeout=600)  # on_ready, after chunking
+        ready = time.monotonic()
+        await asyncio.sleep(args.settle)
+        return {
+            "mode": "lean" if lean else "default",
+            "guilds": args.guilds,
+            "members_per_guild": args.members,
+            "identify_s": round(identified - started, 2),
+            "ready_s": round(ready - started, 2),
+            "chunk_requests": sum(1 for i in fake.gateway_ops if i == 8),
+            **memory_of(bot.pid),
+        }
+    finally:
+        await stop_bot(bot)
+        await fake.stop()
+
+
+async def run(args) -> tp.List[dict]:
+    """
+    Measure the requested modes one after another.
+    Args: parsed arguments
+    Return value: list of summaries
+    """
+    summaries = []
+    for lean in {"default": (False,), "lean": (True,), "both": (False, True)}[args.mode]:
+        summaries.append(await measure(args, lean))
+        print(json.dumps(summaries[-1]), flush=True)
+    return summaries
+
+
+def main() -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--members", type=int, default=10_000, help="members per guild")
+    parser.add_argument("--mode", choices=("default", "lean", "both"), default="both")
+    parser.add_argument("--settle", type=float, default=3, help="seconds to wait after on_ready before measuring")
+    parser.add_argument("--database-url", default="sqlite://:memory:")
+    parser.add_argument("--bot-log", default="loadtest_bot.log")
+    parser.add_argument("--json", help="write the summaries to this file")
+    args = parser.parse_args()
+    summaries = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summaries, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Recount and strategy-simulation speed of the batch tally engine (src/tally.py) against the pure-Python path:
+loops over the ballot rows for the totals, and a Leaderboard for the winners of each setting.
+Works on a synthetic election's rows as db.election_ballots returns them, no bot or database involved.
+Run with `python -m loadtest.tally` from the repository root.
+"""
+import argparse
+import json
+import random
+import time
+import types
+import typing as tp
+
+import src.leaderboard as leaderboard
+import src.tally as tally
+
+
+def make_election(ballots: int, candidates: int, roles: int, seed: int) -> types.SimpleNamespace:
+    """
+    Build an election-like object with random ballots. Every voter votes for one to three candidates.
+    Args: number of ballots, candidates and weighted roles, random seed
+    Return value: object with candidates_votes, ballots (rows of (voter_id, candidate_id, weight, role_id)) and role_weights
+    """
+    rng = random.Random(seed)
+    candidate_ids = [str(10 ** 17 + i) for i in range(candidates)]
+    role_weights = {str(2 * 10 ** 17 + i): rng.randint(1, 5) for i in range(roles)}
+    role_ids = [int(i) for i in role_weights]
+    candidates_votes = {i: [None, 0] for i in candidate_ids}
+    cast = []
+    voter = 3 * 10 ** 17
+    while len(cast) < ballots:
+        voter += 1
+        role = rng.choice(role_ids)
+        for candidate in rng.sample(candidate_ids, min(rng.randint(1, 3), ballots - len(cast))):
+            weight = role_weights[str(role)]
+            cast.append((voter, int(candidate), weight, role))
+            candidates_votes[candidate][1] += weight
+    return types.SimpleNamespace(candidates_votes=candidates_votes, ballots=cast, role_weights=role_weights)
+
+
+def python_recount(election, role_weights: tp.Optional[dict] = None) -> tp.Dict[str, int]:
+    """
+    The pure-Python recount: one dict update per ballot row.
+    Args: election, {role_id: weight} or None for the weights the votes were cast with
+    Return value: {candidate_id: votes}
+    """
+    totals = dict.fromkeys(election.candidates_votes, 0)
+    for _, candidate, weight, role in election.ballots:
+        candidate = str(candidate)
+        if candidate not in totals:
+            continue
+        if role_weights is not None:
+            weight = role_weights.get(str(role), 0)
+        totals[candidate] += weight
+    return totals
+
+
+def timed(function: tp.Callable, repeat: int) -> tp.Tuple[float, tp.Any]:
+    """
+    Run a function several times.
+    Args: function without arguments, number of runs
+    Return value: (best time in seconds, result of the last run)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(args) -> tp.List[dict]:
+    """
+    Time every stage both ways and check that they agree.
+    Args: parsed command line arguments
+    Return value: list of summaries, one per stage
+    """
+    election = make_election(args.ballots, args.candidates, args.roles, args.seed)
+    pools = list(range(1, args.settings + 1))
+    cutoffs = [round(i * args.ballots / args.candidates / args.settings) for i in range(args.settings)]
+    stored = {candidate: votes for candidate, (_, votes) in election.candidates_votes.items()}
+
+    columns_time, ballots = timed(
+        lambda: tally.Ballots.from_rows(list(election.candidates_votes), election.ballots), args.repeat
+    )
+
+    def python_sweep():
+        board = leaderboard.Leaderboard(election.candidates_votes)
+        return [board.top(i) for i in pools] + [board.at_least(i) for i in cutoffs]
+
+    def numpy_sweep():
+        outcomes = tally.Outcomes(tally.stored_totals(election))
+        counts = list(outcomes.pools(pools)) + list(outcomes.cutoffs(cutoffs))
+        return [outcomes.winners(i) for i in counts]
+
+    stages = [
+        ("recount", lambda: python_recount(election), ballots.totals),
+        ("recount at role weights", lambda: python_recount(election, election.role_weights),
+         lambda: ballots.totals(election.role_weights)),
+        (f"{2 * args.settings} settings", python_sweep, numpy_sweep),
+    ]
+    summaries = [{"stage": "rows to columns", "python_s": None, "numpy_s": round(columns_time, 4)}]
+    for name, python, vectorized in stages:
+        python_time, expected = timed(python, args.repeat)
+        numpy_time, result = timed(vectorized, args.repeat)
+        if isinstance(expected, dict):
+            agree = list(expected.values()) == result.tolist()
+        else:
+            agree = [[i for i, _ in winners] for winners in expected] == [
+                [ballots.candidates[i] for i in winners] for winners in result
+            ]
+        summaries.append({
+            "stage": name,
+            "python_s": round(python_time, 4),
+            "numpy_s": round(numpy_time, 4),
+            "speedup": round(python_time / numpy_time, 1),
+            "agree": agree,
+        })
+    summaries[1]["matches_stored_tally"] = python_recount(election) == stored
+    return summaries
+
+
+def main() -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ballots", type=int, default=1_000_000)
+    parser.add_argument("--candidates", type=int, default=200)
+    parser.add_argument("--roles", type=int, default=20, help="weighted roles")
+    parser.add_argument("--settings", type=int, default=10, help="pools and cutoffs to simulate, each")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best one counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the summaries to this file")
+    args = parser.parse_args()
+    summaries = run(args)
+    for summary in summaries:
+        print(json.dumps(summary))
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summaries, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
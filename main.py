@@ -3,8 +3,12 @@ Main runner for Discord bot.
 """
 import asyncio
 
+import src.log as log
+
+log.setup()  # before anything logs
+
 import src.db.db as db
 import src.events as events  # do not touch, removing this import disables the events defined in that file
 import src.internals as internals
 
-internals.bot.run(internals.TOKEN)
\ No newline at end of file
+internals.bot.run(internals.TOKEN, log_handler=None)  # discord.py logs through log.setup's handler
\ No newline at end of file
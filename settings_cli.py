@@ -0,0 +1,403 @@
+"""
+Offline bulk editing of server settings, for operators running the bot in many servers.
+Uses the same database configuration as main.py (DATABASE_URL or the POSTGRES_* variables) and does not need the bot to be running.
+
+python settings_cli.py export [-o settings.json|settings.csv] [--guilds ID,ID,...]
+python settings_cli.py import settings.json|settings.csv [--dry-run] [--create-missing]
+python settings_cli.py set winners_pool=3 winner_selection_strategy=max_votes [--guilds all|ID,ID,...] [--dry-run]
+
+Exports hold the settings as stored. An import only changes the fields present in the file:
+keys of a JSON object, columns of a CSV file (role_weights as JSON text there).
+Every row is checked before anything is written; the writes go in chunks, each in its own transaction.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import typing as tp
+
+from tortoise.transactions import in_transaction
+
+import src.db.db as db
+from src.db.db import ServersSettings
+
+CHUNK = 500  # rows read or written per query, and written per transaction
+FIELDS = (
+    "reward_roles",
+    "role_weights",
+    "winners_pool",
+    "prefixes",
+    "election_managers",
+    "winner_selection_strategy",
+    "votes_cutoff",
+    "board_mode",
+)
+
+
+def _id_list(value: tp.Any) -> str:
+    """
+    Check a comma-separated list of ids (a list of ids is accepted too).
+    """
+    if isinstance(value, list):
+        value = ",".join(str(i) for i in value)
+    value = str(value)
+    if not all(i.strip().isdigit() for i in value.split(",") if i.strip()):
+        raise ValueError(f"expected comma-separated ids, got {value!r}")
+    return value
+
+
+def _role_weights(value: tp.Any) -> tp.Optional[dict]:
+    """
+    Check a {role_id: weight} mapping, given as an object or as JSON text. Empty means no weights.
+    """
+    if value in (None, ""):
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError(f"expected a JSON object, got {value!r}")
+    if not isinstance(value, dict):
+        raise ValueError(f"expected a {{role_id: weight}} object, got {value!r}")
+    weights = {}
+    for role, weight in value.items():
+        if not str(role).isdigit() or isinstance(weight, bool):
+            raise ValueError(f"expected a role id and an integer weight, got {role!r}: {weight!r}")
+        try:
+            weights[str(role)] = int(weight)
+        except (TypeError, ValueError):
+            raise ValueError(f"expected an integer weight for role {role}, got {weight!r}")
+    return weights
+
+
+def _integer(minimum: int) -> tp.Callable[[tp.Any], int]:
+    """
+    Make a check for an integer of at least `minimum`.
+    """
+    def check(value):
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"expected an integer, got {value!r}")
+        if number < minimum:
+            raise ValueError(f"expected at least {minimum}, got {number}")
+        return number
+    return check
+
+
+def _prefixes(value: tp.Any) -> str:
+    """
+    Check a comma-separated list of prefixes.
+    """
+    value = str(value)
+    if not [i for i in value.split(",") if i] or "<" in value.split(","):
+        raise ValueError(f"expected comma-separated prefixes other than \"<\", got {value!r}")
+    return value
+
+
+def _choice(*choices: str) -> tp.Callable[[tp.Any], str]:
+    """
+    Make a check for one of `choices`.
+    """
+    def check(value):
+        if value not in choices:
+            raise ValueError(f"expected one of {', '.join(choices)}, got {value!r}")
+        return value
+    return check
+
+
+CHECKS = {  # dict: {field: function turning an imported value into the stored one, raises ValueError}
+    "reward_roles": _id_list,
+    "role_weights": _role_weights,
+    "winners_pool": _integer(1),
+    "prefixes": _prefixes,
+    "election_managers": _id_list,
+    "winner_selection_strategy": _choice("max_votes", "cutoff"),
+    "votes_cutoff": _integer(0),
+    "board_mode": _choice("reactions", "buttons"),
+}
+
+
+def file_format(path: tp.Optional[str], requested: tp.Optional[str]) -> str:
+    """
+    Pick the file format: the one asked for, else the file's extension, else JSON.
+    Args: file path or None for stdin/stdout, --format value
+    Return value: "json" or "csv"
+    """
+    if requested:
+        return requested
+    return "csv" if path and path.lower().endswith(".csv") else "json"
+
+
+def parse_guilds(value: str) -> tp.Optional[tp.List[int]]:
+    """
+    Parse --guilds.
+    Args: "all" or comma-separated server ids
+    Return value: list of server ids, None for all
+    """
+    if value == "all":
+        return None
+    try:
+        return [int(i) for i in value.split(",") if i.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected `all` or comma-separated server ids")
+
+
+async def stored_settings(server_ids: tp.Optional[tp.List[int]] = None) -> tp.AsyncIterator[ServersSettings]:
+    """
+    Read settings CHUNK rows per query, in server id order.
+    Args: server ids to read, None for every server
+    Return value: async iterator over ServersSettings
+    """
+    if server_ids is not None:
+        server_ids = sorted(set(server_ids))
+        for i in range(0, len(server_ids), CHUNK):
+            for row in await ServersSettings.filter(server_id__in=server_ids[i:i + CHUNK]).order_by("server_id"):
+                yield row
+        return
+    last = None
+    while True:
+        query = ServersSettings.all() if last is None else ServersSettings.filter(server_id__gt=last)
+        rows = await query.order_by("server_id").limit(CHUNK)
+        for row in rows:
+            yield row
+        if len(rows) < CHUNK:
+            return
+        last = rows[-1].server_id
+
+
+async def export_settings(args) -> int:
+    """
+    Write stored settings to a file or stdout.
+    Args: parsed arguments
+    Return value: exit code
+    """
+    rows = [
+        {"server_id": i.server_id, **{field: getattr(i, field) for field in FIELDS}}
+        async for i in stored_settings(args.guilds)
+    ]
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if file_format(args.output, args.format) == "csv":
+            writer = csv.DictWriter(output, fieldnames=("server_id",) + FIELDS)
+            writer.writeheader()
+            for row in rows:
+                row["role_weights"] = json.dumps(row["role_weights"]) if row["role_weights"] is not None else ""
+                writer.writerow(row)
+        else:
+            json.dump(rows, output, indent=2)
+            output.write("\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Exported {len(rows)} servers.", file=sys.stderr)
+    return 0
+
+
+def read_rows(path: str, requested: tp.Optional[str]) -> tp.List[dict]:
+    """
+    Read an import file.
+    Args: file path ("-" for stdin), --format value
+    Return value: list of {"server_id": ..., field: value} dicts
+    """
+    source = sys.stdin if path == "-" else open(path, newline="")
+    try:
+        text = source.read()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    if file_format(None if path == "-" else path, requested) == "csv":
+        return list(csv.DictReader(io.StringIO(text)))
+    rows = json.loads(text)
+    if not isinstance(rows, list) or not all(isinstance(i, dict) for i in rows):
+        raise ValueError("expected a JSON array of objects")
+    return rows
+
+
+def check_fields(values: dict) -> tp.Tuple[dict, tp.List[str]]:
+    """
+    Check imported values and turn them into stored ones.
+    Args: {field: value}
+    Return value: ({field: stored value}, list of problems)
+    """
+    fields, problems = {}, []
+    for field, value in values.items():
+        if field not in CHECKS:
+            problems.append(f"unknown field {field!r}")
+            continue
+        try:
+            fields[field] = CHECKS[field](value)
+        except ValueError as error:
+            problems.append(f"{field}: {error}")
+    return fields, problems
+
+
+def check_rows(rows: tp.List[dict]) -> tp.Tuple[tp.Dict[int, dict], tp.List[str]]:
+    """
+    Check imported rows. Later rows for the same server win.
+    Args: rows as read
+    Return value: ({server_id: {field: stored value}}, list of problems)
+    """
+    changes, problems = {}, []
+    for number, row in enumerate(rows, 1):
+        row = dict(row)
+        try:
+            server_id = int(row.pop("server_id", None))
+        except (TypeError, ValueError):
+            problems.append(f"row {number}: expected a server_id")
+            continue
+        fields, row_problems = check_fields(row)
+        changes.setdefault(server_id, {}).update(fields)
+        problems.extend(f"row {number}, {i}" for i in row_problems)
+    return changes, problems
+
+
+async def plan(changes: tp.Dict[int, dict], create_missing: bool):
+    """
+    Compare the wanted settings to the stored ones.
+    Args: {server_id: {field: value}}, whether to create settings for servers that have none
+    Return value: (rows to update with the fields to write, rows to create, list of diff lines,
+    number of unchanged servers, ids of missing servers skipped)
+    """
+    updates, diff = [], []
+    unchanged = 0
+    async for server in stored_settings(list(changes)):
+        wanted = changes.pop(server.server_id)
+        changed = {field: value for field, value in wanted.items() if getattr(server, field) != value}
+        if not changed:
+            unchanged += 1
+            continue
+        for field, value in changed.items():
+            diff.append(f"{server.server_id}: {field}: {getattr(server, field)!r} -> {value!r}")
+            setattr(server, field, value)
+        updates.append((server, set(changed)))
+    creates, skipped = [], []
+    for server_id, wanted in sorted(changes.items()):  # servers without settings
+        if not create_missing:
+            skipped.append(server_id)
+            continue
+        diff.append(f"{server_id}: create with {wanted!r}")
+        creates.append(ServersSettings(server_id=server_id, **wanted))
+    return updates, creates, diff, unchanged, skipped
+
+
+async def apply(changes: tp.Dict[int, dict], dry_run: bool, create_missing: bool) -> int:
+    """
+    Show the diff and, unless it is a dry run, write it.
+    Args: {server_id: {field: value}}, dry run, whether to create settings for servers that have none
+    Return value: exit code
+    """
+    updates, creates, diff, unchanged, skipped = await plan(changes, create_missing)
+    for line in diff:
+        print(line)
+    if skipped:
+        print(
+            f"Skipped {len(skipped)} servers without settings (pass --create-missing to create them): "
+            + ", ".join(str(i) for i in skipped),
+            file=sys.stderr,
+        )
+    summary = f"{len(updates)} to update, {len(creates)} to create, {unchanged} unchanged."
+    if dry_run:
+        print(f"Dry run, nothing written: {summary}", file=sys.stderr)
+        return 0
+    for i in range(0, len(updates), CHUNK):
+        chunk = updates[i:i + CHUNK]
+        fields = sorted(set().union(*(changed for _, changed in chunk)))  # bulk_update writes one field list
+        async with in_transaction():
+            await ServersSettings.bulk_update([server for server, _ in chunk], fields=fields)
+    for i in range(0, len(creates), CHUNK):
+        async with in_transaction():
+            await ServersSettings.bulk_create(creates[i:i + CHUNK])
+    print(f"Done: {summary}", file=sys.stderr)
+    return 0
+
+
+async def import_settings(args) -> int:
+    """
+    Import settings from a file.
+    Args: parsed arguments
+    Return value: exit code
+    """
+    try:
+        rows = read_rows(args.file, args.format)
+    except (OSError, ValueError) as error:
+        print(f"Cannot read {args.file}: {error}", file=sys.stderr)
+        return 1
+    changes, problems = check_rows(rows)
+    if problems:
+        print("Nothing imported, fix these first:", *problems, sep="\n", file=sys.stderr)
+        return 1
+    return await apply(changes, args.dry_run, args.create_missing)
+
+
+async def set_settings(args) -> int:
+    """
+    Set the same fields in many servers.
+    Args: parsed arguments
+    Return value: exit code
+    """
+    wanted = {}
+    for assignment in args.assignments:
+        field, separator, value = assignment.partition("=")
+        if not separator:
+            print(f"Expected field=value, got {assignment!r}", file=sys.stderr)
+            return 1
+        wanted[field] = value
+    fields, problems = check_fields(wanted)
+    if problems:
+        print("Nothing changed, fix these first:", *problems, sep="\n", file=sys.stderr)
+        return 1
+    server_ids = args.guilds
+    if server_ids is None:
+        server_ids = [i.server_id async for i in stored_settings()]
+    return await apply({i: dict(fields) for i in server_ids}, args.dry_run, create_missing=False)
+
+
+def arguments() -> argparse.ArgumentParser:
+    """
+    Build the command line parser.
+    """
+    parser = argparse.ArgumentParser(description="Export and import server settings in bulk.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Write stored settings as JSON or CSV.")
+    export.add_argument("-o", "--output", help="file to write, stdout by default")
+    export.add_argument("--format", choices=("json", "csv"), help="defaults to the output file's extension, else JSON")
+    export.add_argument("--guilds", type=parse_guilds, default=None, help="`all` (default) or comma-separated server ids")
+    export.set_defaults(run=export_settings)
+
+    load = commands.add_parser("import", help="Apply settings from a JSON or CSV file.")
+    load.add_argument("file", help="file to read, - for stdin")
+    load.add_argument("--format", choices=("json", "csv"), help="defaults to the file's extension, else JSON")
+    load.add_argument("--dry-run", action="store_true", help="only print what would change")
+    load.add_argument(
+        "--create-missing", action="store_true",
+        help="create settings for servers that have none, e.g. when restoring into a new database",
+    )
+    load.set_defaults(run=import_settings)
+
+    assign = commands.add_parser("set", help="Set fields to the same value in many servers.")
+    assign.add_argument("assignments", nargs="+", metavar="field=value", help=f"fields: {', '.join(FIELDS)}")
+    assign.add_argument("--guilds", type=parse_guilds, default=None, help="`all` (default) or comma-separated server ids")
+    assign.add_argument("--dry-run", action="store_true", help="only print what would change")
+    assign.set_defaults(run=set_settings)
+    return parser
+
+
+async def main(args) -> int:
+    """
+    Connect to the database and run the subcommand.
+    Args: parsed arguments
+    Return value: exit code
+    """
+    await db.init()
+    try:
+        return await args.run(args)
+    finally:
+        await db.db_cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(arguments().parse_args())))
@@ -0,0 +1,143 @@
+"""
+Per-minute election rollups.
+The vote path only adds to in-memory counters (record() does no I/O); every FLUSH_INTERVAL seconds
+the counters are upserted into the election_rollups table, one row per
+(election, minute, dimension, subject) holding the net change and the number of vote changes.
+Dimensions: "candidate" (weighted votes per candidate), "role" (weighted votes per voter's role)
+and "voters" (distinct voters, subject 0). Anything historical is then a scan over the buckets,
+never over individual votes.
+"""
+import asyncio
+import time
+
+from tortoise import Tortoise
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+import src.log as log
+import src.metrics as metrics
+
+FLUSH_INTERVAL = 10.0  # seconds between writes of the buffered rollups
+UPSERT_BATCH = 500  # rows per executemany
+logger = log.get_logger("analytics")
+
+_COLUMNS = '"server_id", "election_id", "minute", "dimension", "subject_id", "delta", "events"'
+_CONFLICT = (
+    'ON CONFLICT ("election_id", "minute", "dimension", "subject_id") DO UPDATE SET '
+    '"delta" = "election_rollups"."delta" + EXCLUDED."delta", '
+    '"events" = "election_rollups"."events" + EXCLUDED."events"'
+)
+UPSERT = {
+    "postgres": f'INSERT INTO "election_rollups" ({_COLUMNS}) VALUES ($1, $2, $3, $4, $5, $6, $7) {_CONFLICT}',
+    "sqlite": f'INSERT INTO "election_rollups" ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?) {_CONFLICT}',
+}
+
+
+def current_minute() -> int:
+    """
+    Get the current rollup bucket.
+    Args: None
+    Return value: minutes since the epoch of type int
+    """
+    return int(time.time() // 60)
+
+
+class RollupBuffer:
+    """
+    In-memory rollup counters, written out periodically.
+    """
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        """
+        Args: seconds between flushes
+        Return value: None
+        """
+        self.interval = interval
+        self.pending = {}  # dict: {(server_id, election_id, minute, dimension, subject_id): [delta, events]}
+        self._timer = None
+
+    def record(self, server_id: int, election_id: int, dimension: str, subject_id: int, delta: int) -> None:
+        """
+        Count a change. Does no I/O.
+        Args: server id, election id, dimension ("candidate", "role" or "voters"), candidate/role id (0 for voters), change
+        Return value: None
+        """
+        key = (server_id, election_id, current_minute(), dimension, subject_id or 0)  # a role id can be None
+        counters = self.pending.setdefault(key, [0, 0])
+        counters[0] += delta
+        counters[1] += 1
+        self._schedule()
+
+    def _schedule(self) -> None:
+        """
+        Make sure a flush is due.
+        """
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.interval, lambda: asyncio.create_task(self.flush(), name="analytics-flush")
+            )
+
+    async def flush(self) -> None:
+        """
+        Write out every pending counter. Counters that fail to be written are kept for the next flush,
+        except ones the database rejects: those are dropped so that they don't hold back every other counter.
+        Args: None
+        Return value: None
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        rows = [(*key, delta, events) for key, (delta, events) in pending.items()]
+        try:
+            async with in_transaction() as connection:
+                query = UPSERT[Tortoise.get_connection("default").capabilities.dialect]
+                for i in range(0, len(rows), UPSERT_BATCH):
+                    await connection.execute_many(query, rows[i:i + UPSERT_BATCH])
+        except IntegrityError:
+            logger.warning("Writing election rollups one by one after a rejected row", extra=log.fields(rows=len(rows)))
+            await self._flush_each(pending)
+            return
+        except Exception:
+            metrics.increment("analytics.flush_failed")
+            logger.exception("Failed to write election rollups", extra=log.fields(rows=len(rows)))
+            self._requeue(pending)
+            return
+        metrics.increment("analytics.rows_written", len(rows))
+
+    async def _flush_each(self, pending: dict) -> None:
+        """
+        Write counters one at a time, dropping the ones the database rejects.
+        If the database fails otherwise, the counters not written yet are kept for the next flush.
+        """
+        connection = Tortoise.get_connection("default")
+        query = UPSERT[connection.capabilities.dialect]
+        for key, (delta, events) in list(pending.items()):
+            try:
+                await connection.execute_query(query, [*key, delta, events])
+            except IntegrityError:
+                metrics.increment("analytics.rows_dropped")
+                logger.exception("Dropped an election rollup", extra=log.fields(key=list(key), delta=delta))
+            except Exception:
+                metrics.increment("analytics.flush_failed")
+                logger.exception("Failed to write election rollups", extra=log.fields(rows=len(pending)))
+                self._requeue(pending)
+                return
+            else:
+                metrics.increment("analytics.rows_written")
+            del pending[key]
+
+    def _requeue(self, pending: dict) -> None:
+        """
+        Put counters that were not written back in the buffer and schedule another flush.
+        """
+        for key, (delta, events) in pending.items():
+            counters = self.pending.setdefault(key, [0, 0])
+            counters[0] += delta
+            counters[1] += events
+        self._schedule()
+
+
+rollups = RollupBuffer()  # module-level so that buffered counts survive reloading the cogs
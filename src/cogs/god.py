@@ -1,10 +1,20 @@
 """
 God mode commands.
 """
+import datetime
+import io
 
+import discord
 from discord.ext import commands
 import src.internals as internals
 import src.db.db as db
+import src.metrics as metrics
+import src.log as log
+import src.profiling as profiling
+import src.watchdog as watchdog
+
+MESSAGE_LIMIT = 2000  # characters in a Discord message
+logger = log.get_logger("god")
 
 class God(commands.Cog):
     """
@@ -23,7 +33,7 @@ class God(commands.Cog):
         """
         god = (await self.bot.application_info()).owner
         await self.bot.close()
-        print(f"Successfully caught fire via override from {god}.")
+        logger.warning("Successfully caught fire", extra=log.fields(owner=str(god)))
 
     @halt_and_catch_fire.error
     async def halt_and_catch_fire_error(self, ctx, error):
@@ -32,4 +42,191 @@ class God(commands.Cog):
         Args: context, error
         Return value: None
         """
-        await ctx.reply(f"Failed to self-destruct. Reason: {error}")
\ No newline at end of file
+        await ctx.reply(f"Failed to self-destruct. Reason: {error}")
+
+    @commands.is_owner()
+    @commands.command(name="reload-cog", help="Reload a cog in place without reconnecting.")
+    async def reload_cog(self, ctx, name):
+        """
+        Reload a cog extension, keeping the gateway session.
+        Args: cog module name (e.g. `voting` or `src.cogs.voting`)
+        Return value: None
+        """
+        extension = name if name.startswith("src.cogs.") else f"src.cogs.{name}"
+        if extension not in internals.EXTENSIONS:
+            raise commands.errors.UserInputError(
+                f"Unknown cog `{name}`. Available: {', '.join(internals.EXTENSIONS)}"
+            )
+        import_time, setup_time = await internals.reload_extension(extension)
+        await ctx.reply(
+            f"Reloaded `{extension}`: import {import_time * 1000:.1f} ms, setup {setup_time * 1000:.1f} ms"
+        )
+
+    @reload_cog.error
+    async def reload_cog_error(self, ctx, error):
+        """
+        reload-cog error handling.
+        Args: context, error
+        Return value: None
+        """
+        if isinstance(error, commands.errors.MissingRequiredArgument):
+            await ctx.reply("Please specify which cog to reload.")
+        else:
+            await ctx.reply(f"Failed to reload. Reason: {error}")
+
+    @commands.is_owner()
+    @commands.command(name="view-cog-timings", help="Show how long each cog took to import and set up.")
+    async def view_cog_timings(self, ctx):
+        """
+        Show the import and setup time of every loaded cog.
+        Args: None except context
+        Return value: None
+        """
+        lines = [
+            f"`{extension}`: import {import_time * 1000:.1f} ms, setup {setup_time * 1000:.1f} ms"
+            for extension, (import_time, setup_time) in internals.extension_timings.items()
+        ]
+        await ctx.reply("\n".join(lines) or "No cogs loaded.")
+
+    @view_cog_timings.error
+    async def view_cog_timings_error(self, ctx, error):
+        """
+        view-cog-timings error handling.
+        Args: context, error
+        Return value: None
+        """
+        await ctx.reply(f"{error}")
+
+    @commands.is_owner()
+    @commands.command(name="view-metrics", help="Show the bot's internal counters.")
+    async def view_metrics(self, ctx):
+        """
+        Show every metric counter.
+        Args: None except context
+        Return value: None
+        """
+        lines = [f"{name}: {value}" for name, value in metrics.snapshot().items()]
+        await ctx.reply("```\n" + ("\n".join(lines) or "Nothing recorded yet.") + "\n```")
+
+    @view_metrics.error
+    async def view_metrics_error(self, ctx, error):
+        """
+        view-metrics error handling.
+        Args: context, error
+        Return value: None
+        """
+        await ctx.reply(f"{error}")
+
+    @commands.is_owner()
+    @commands.command(name="view-stalls", help="Show the recent event loop stalls and what was running.")
+    async def view_stalls(self, ctx):
+        """
+        Show the most recent event loop stalls caught by the watchdog, with the loop thread's stack during each.
+        Args: None except context
+        Return value: None
+        """
+        if not watchdog.monitor.stalls:
+            await ctx.reply("No stalls recorded.")
+            return
+        report = "\n\n".join(
+            f"{stall['at']:%Y-%m-%d %H:%M:%S} {round(stall['lag'] * 1000)} ms in {stall['task']}\n" + "".join(stall["stack"])
+            for stall in reversed(watchdog.monitor.stalls)
+        )
+        if len(report) + 8 > MESSAGE_LIMIT:
+            name = f"stalls-{datetime.datetime.now():%Y%m%d-%H%M%S}.txt"
+            await ctx.reply(file=discord.File(io.BytesIO(report.encode()), filename=name))
+        else:
+            await ctx.reply(f"```\n{report}\n```")
+
+    @view_stalls.error
+    async def view_stalls_error(self, ctx, error):
+        """
+        view-stalls error handling.
+        Args: context, error
+        Return value: None
+        """
+        await ctx.reply(f"{error}")
+
+    @commands.is_owner()
+    @commands.command(name="profile-cpu", help="Start or stop sampling where the event loop spends its time.")
+    async def profile_cpu(self, ctx, action):
+        """
+        Start a sampling profile of the event loop thread, or stop it and upload the collapsed stacks
+        (one "module:function;...;module:function samples" line per stack, feed to flamegraph.pl or speedscope).
+        Args: action of type str in ("start", "stop")
+        Return value: None
+        """
+        if action == "start":
+            profiling.cpu.start()
+            await ctx.reply(
+                f"Sampling every {profiling.cpu.interval * 1000:g} ms for at most {profiling.cpu.max_duration} s. "
+                "Run `profile-cpu stop` to get the profile."
+            )
+        elif action == "stop":
+            collapsed = profiling.cpu.stop()
+            samples = sum(profiling.cpu.samples.values())
+            name = f"cpu-{datetime.datetime.now():%Y%m%d-%H%M%S}.collapsed"
+            await ctx.reply(
+                f"{samples} samples over {profiling.cpu.duration:.1f} s.",
+                file=discord.File(io.BytesIO(collapsed.encode()), filename=name),
+            )
+        else:
+            raise commands.errors.UserInputError("Only `start` or `stop` allowed.")
+
+    @profile_cpu.error
+    async def profile_cpu_error(self, ctx, error):
+        """
+        profile-cpu error handling.
+        Args: context, error
+        Return value: None
+        """
+        if isinstance(error, commands.errors.MissingRequiredArgument):
+            await ctx.reply("Command syntax: `profile-cpu start|stop`")
+        else:
+            await ctx.reply(f"{error}")
+
+    @commands.is_owner()
+    @commands.command(name="profile-memory", help="Trace allocations and show what grew between snapshots.")
+    async def profile_memory(self, ctx, action):
+        """
+        Turn tracemalloc on (taking a baseline snapshot), show the top allocation differences
+        since the previous snapshot, or turn it off again.
+        Args: action of type str in ("start", "diff", "stop")
+        Return value: None
+        """
+        if action == "start":
+            await profiling.memory.start()
+            await ctx.reply("Tracing allocations. Run `profile-memory diff` to compare with this snapshot.")
+        elif action == "diff":
+            report = "\n".join(await profiling.memory.diff())
+            if len(report) + 8 > MESSAGE_LIMIT:
+                name = f"memory-{datetime.datetime.now():%Y%m%d-%H%M%S}.txt"
+                await ctx.reply(file=discord.File(io.BytesIO(report.encode()), filename=name))
+            else:
+                await ctx.reply(f"```\n{report}\n```")
+        elif action == "stop":
+            profiling.memory.stop()
+            await ctx.reply("Stopped tracing allocations.")
+        else:
+            raise commands.errors.UserInputError("Only `start`, `diff` or `stop` allowed.")
+
+    @profile_memory.error
+    async def profile_memory_error(self, ctx, error):
+        """
+        profile-memory error handling.
+        Args: context, error
+        Return value: None
+        """
+        if isinstance(error, commands.errors.MissingRequiredArgument):
+            await ctx.reply("Command syntax: `profile-memory start|diff|stop`")
+        else:
+            await ctx.reply(f"{error}")
+
+
+async def setup(bot):
+    """
+    Extension entry point.
+    Args: bot object
+    Return value: None
+    """
+    await internals.setup_cog(bot, God, __name__)
@@ -0,0 +1,329 @@
+"""
+Cog running background database maintenance: purging elections and settings nobody can reach anymore.
+"""
+import collections
+import datetime
+import itertools
+
+import discord
+from discord.ext import commands, tasks
+from tortoise.transactions import in_transaction
+
+import src.db.db as db
+import src.internals as internals
+import src.log as log
+import src.metrics as metrics
+from src.db.db import ElectionBallots, ElectionBoards, Elections, ServersSettings
+
+MAINTENANCE_INTERVAL = 6  # hours between runs
+SCAN_BATCH = 500  # rows read per query while scanning
+PURGE_CHUNK = 100  # rows deleted per transaction, so no lock is held for long
+BOARD_CHECKS_PER_RUN = 20  # voting boards fetched per run to catch deletions the bot did not see
+STALE_START = datetime.timedelta(hours=1)  # an election without a board this old never finished starting
+logger = log.get_logger("maintenance")
+
+
+class Maintenance(commands.Cog):
+    """
+    Background garbage collection of orphaned elections and server settings.
+    """
+
+    def __init__(self, bot):
+        """
+        Initialize the cog and start the maintenance loop.
+        Args: bot object
+        Return value: None
+        """
+        self.bot = bot
+        self.board_messages = set()  # set of voting board message ids, as of the last run
+        self.deleted_boards = set()  # set of voting board message ids deleted while the bot was watching
+        self.board_cursor = 0  # election id the next run's board checks continue after
+        self.last_report = None  # dict: {"finished": datetime, "purged": {reason: count}, ...}
+        self.collect.start()
+
+    def cog_unload(self):
+        """
+        Stop the maintenance loop.
+        Args: None
+        Return value: None
+        """
+        self.collect.cancel()
+
+    def is_board(self, message_id):
+        """
+        Check whether a message is a voting board message: one known at the last run, or one posted since
+        (new boards are indexed by the Voting cog right away).
+        Args: message id
+        Return value: bool
+        """
+        if message_id in self.board_messages:
+            return True
+        voting = self.bot.get_cog("Voting")
+        return voting is not None and message_id in voting.board_index
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        """
+        Remember deleted voting board messages, the next run purges their elections.
+        Args: none except payload (a Discord structure)
+        Return value: None
+        """
+        if payload.guild_id is not None and self.is_board(payload.message_id):
+            self.deleted_boards.add(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        """
+        Bulk version of on_raw_message_delete.
+        Args: none except payload (a Discord structure)
+        Return value: None
+        """
+        if payload.guild_id is not None:
+            self.deleted_boards.update(i for i in payload.message_ids if self.is_board(i))
+
+    @tasks.loop(hours=MAINTENANCE_INTERVAL)
+    async def collect(self):
+        """
+        One scheduled maintenance run. A failure is logged and the next run goes ahead as planned.
+        Args: None
+        Return value: None
+        """
+        try:
+            await self.run()
+        except Exception:
+            metrics.increment("maintenance.failed")
+            logger.exception("Maintenance run failed")
+
+    @collect.before_loop
+    async def before_collect(self):
+        """
+        Wait for the guild cache and the database, an empty cache would make every election look orphaned.
+        """
+        await self.bot.wait_until_ready()
+        await db.initialized.wait()
+
+    async def run(self):
+        """
+        Find and purge orphaned elections and settings.
+        Args: None
+        Return value: report of type dict
+        """
+        started = datetime.datetime.now()
+        deleted_boards, self.deleted_boards = self.deleted_boards, set()
+        orphans = collections.defaultdict(list)  # dict: {reason: [election ids]}
+        missing_channels = collections.defaultdict(list)  # dict: {channel_id: [election ids]}, not in the cache
+        async for election in self._scan_elections():
+            reason = self._orphan_reason(election, started)
+            if reason == "channel_missing":
+                missing_channels[election["channel_id"]].append(election["id"])
+            elif reason:
+                orphans[reason].append(election["id"])
+        orphans["channel_deleted"].extend(await self._deleted_channels(missing_channels))
+        orphans["board_deleted"].extend(await self._board_elections(deleted_boards))
+        for reason, ids in (await self._check_boards()).items():
+            orphans[reason].extend(ids)
+        purged = {reason: await self._purge(Elections, "id", ids) for reason, ids in orphans.items()}
+        orphan_ids = list(itertools.chain.from_iterable(orphans.values()))
+        await self._purge(ElectionBoards, "election_id", orphan_ids)
+        await self._purge(ElectionBallots, "election_id", orphan_ids)
+        voting = self.bot.get_cog("Voting")
+        if voting is not None:
+            for i in orphan_ids:
+                voting.forget_election(i)
+        settings = [
+            i["server_id"] async for i in self._scan(ServersSettings, "server_id", ("server_id",))
+            if self.bot.get_guild(i["server_id"]) is None
+        ]
+        purged["settings_guild_left"] = await self._purge(ServersSettings, "server_id", settings)
+        self.board_messages = {i["message_id"] async for i in self._scan(ElectionBoards, "id", ("id", "message_id"))}
+        purged = {reason: count for reason, count in purged.items() if count}
+        for reason, count in purged.items():
+            metrics.increment(f"maintenance.purged.{reason}", count)
+        self.last_report = {
+            "finished": datetime.datetime.now(),
+            "seconds": (datetime.datetime.now() - started).total_seconds(),
+            "purged": purged,
+        }
+        logger.info("Maintenance run finished", extra=log.fields(seconds=self.last_report["seconds"], **purged))
+        return self.last_report
+
+    @staticmethod
+    async def _scan(model, key, columns):
+        """
+        Read a whole table in key order, SCAN_BATCH rows per query (keyset pagination, no OFFSET).
+        Args: model, key column, columns to read
+        Return value: async iterator over dicts
+        """
+        last = None
+        while True:
+            query = model.all() if last is None else model.filter(**{f"{key}__gt": last})
+            rows = await query.order_by(key).limit(SCAN_BATCH).values(*columns)
+            for row in rows:
+                yield row
+            if len(rows) < SCAN_BATCH:
+                return
+            last = rows[-1][key]
+
+    def _scan_elections(self):
+        """
+        Read every election's bookkeeping columns in batches.
+        """
+        return self._scan(Elections, "id", ("id", "server_id", "channel_id", "progress_message", "timestamp"))
+
+    def _orphan_reason(self, election, now):
+        """
+        Decide whether an election is orphaned, using only the cache.
+        A channel missing from the cache (e.g. an archived thread) is only reported as "channel_missing",
+        for _deleted_channels to confirm.
+        Args: election row, time of the run
+        Return value: reason of type str, or None if the election is fine
+        """
+        guild = self.bot.get_guild(election["server_id"])
+        if guild is None:
+            return "guild_left"
+        if guild.unavailable:
+            return None  # outage, the cache cannot tell
+        if election["channel_id"] is not None and guild.get_channel_or_thread(election["channel_id"]) is None:
+            return "channel_missing"
+        if election["progress_message"] is None and election["timestamp"].replace(tzinfo=None) < now - STALE_START:
+            return "never_posted"
+        return None
+
+    async def _deleted_channels(self, missing):
+        """
+        Fetch the channels missing from the cache, only the ones Discord no longer has count as deleted.
+        Args: {channel_id: [election ids]}
+        Return value: election ids of type list
+        """
+        deleted = []
+        for channel_id, ids in missing.items():
+            try:
+                await self.bot.fetch_channel(channel_id)
+            except discord.errors.NotFound:
+                deleted.extend(ids)
+            except discord.errors.HTTPException:
+                pass  # no access or a hiccup, try again next run
+        return deleted
+
+    @staticmethod
+    async def _board_elections(message_ids):
+        """
+        Find the elections a set of board messages belong to, any page of a board counts.
+        Args: message ids
+        Return value: election ids of type list
+        """
+        message_ids = list(message_ids)
+        elections = set()
+        for i in range(0, len(message_ids), SCAN_BATCH):
+            elections.update(
+                await ElectionBoards.filter(message_id__in=message_ids[i:i + SCAN_BATCH]).values_list("election_id", flat=True)
+            )
+        return list(elections)
+
+    async def _check_boards(self):
+        """
+        Fetch a few voting board messages to catch the ones deleted while the bot was offline.
+        Walks through every page of every board BOARD_CHECKS_PER_RUN at a time, continuing where the last run stopped.
+        Args: None
+        Return value: dict {"board_deleted": [election ids]}
+        """
+        boards = await (
+            ElectionBoards.filter(id__gt=self.board_cursor)
+            .order_by("id")
+            .limit(BOARD_CHECKS_PER_RUN)
+            .values("id", "election_id", "message_id")
+        )
+        self.board_cursor = boards[-1]["id"] if len(boards) == BOARD_CHECKS_PER_RUN else 0
+        channels = dict(
+            await Elections.filter(id__in={i["election_id"] for i in boards}, channel_id__isnull=False).values_list(
+                "id", "channel_id"
+            )
+        )
+        deleted = set()
+        for board in boards:
+            if board["election_id"] not in channels:
+                continue  # channel unknown, or the election is gone and _purge removes the board
+            channel = self.bot.get_partial_messageable(channels[board["election_id"]])  # works for uncached threads too
+            try:
+                await channel.fetch_message(board["message_id"])
+            except discord.errors.NotFound:
+                deleted.add(board["election_id"])  # the message, or its whole channel
+            except discord.errors.HTTPException:
+                pass  # no access or a hiccup, try again next time around
+        return {"board_deleted": list(deleted)}
+
+    @staticmethod
+    async def _purge(model, key, ids):
+        """
+        Delete rows PURGE_CHUNK at a time, each chunk in its own short transaction.
+        Args: model, key column, key values
+        Return value: number of rows deleted
+        """
+        deleted = 0
+        for i in range(0, len(ids), PURGE_CHUNK):
+            async with in_transaction():
+                deleted += await model.filter(**{f"{key}__in": ids[i:i + PURGE_CHUNK]}).delete()
+        return deleted
+
+    @commands.is_owner()
+    @commands.command(name="run-maintenance", help="Purge orphaned elections and settings now.")
+    async def run_maintenance(self, ctx):
+        """
+        Run the maintenance right away instead of waiting for the next scheduled run.
+        Args: None except context
+        Return value: None
+        """
+        await ctx.reply(self.format_report(await self.run()))
+
+    @run_maintenance.error
+    async def run_maintenance_error(self, ctx, error):
+        """
+        run-maintenance error handling.
+        Args: context, error
+        Return value: None
+        """
+        await ctx.reply(f"{error}")
+
+    @commands.is_owner()
+    @commands.command(name="view-maintenance", help="Show what the last maintenance run removed.")
+    async def view_maintenance(self, ctx):
+        """
+        Show the report of the last maintenance run.
+        Args: None except context
+        Return value: None
+        """
+        if self.last_report is None:
+            await ctx.reply("Maintenance has not run yet.")
+            return
+        await ctx.reply(self.format_report(self.last_report))
+
+    @view_maintenance.error
+    async def view_maintenance_error(self, ctx, error):
+        """
+        view-maintenance error handling.
+        Args: context, error
+        Return value: None
+        """
+        await ctx.reply(f"{error}")
+
+    @staticmethod
+    def format_report(report):
+        """
+        Render a maintenance report.
+        Args: report of type dict
+        Return value: text of type str
+        """
+        lines = [f"Maintenance finished at {report['finished']:%Y-%m-%d %H:%M:%S} in {report['seconds']:.1f} s."]
+        lines.extend(f"{reason}: {count}" for reason, count in report["purged"].items())
+        if not report["purged"]:
+            lines.append("Nothing to purge.")
+        return "\n".join(lines)
+
+
+async def setup(bot):
+    """
+    Extension entry point.
+    Args: bot object
+    Return value: None
+    """
+    await internals.setup_cog(bot, Maintenance, __name__)
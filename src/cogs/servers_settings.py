@@ -45,6 +45,7 @@ class Settings(commands.Cog):
             raise commands.errors.UserInputError("Discord requires usernames to be 32 characters or less in length, and you supplied more, so the bot cannot rename itself.\nPlease select fewer and/or shorter prefixes.")
         server.prefixes = prefix_str
         await server.save()
+        internals.reads.invalidate(ctx.guild.id)
         await ctx.guild.get_member(self.bot.user.id).edit(nick=nickname)
         await ctx.reply("New prefixes set!")
 
@@ -84,6 +85,7 @@ class Settings(commands.Cog):
         guild_managers = list(set([str(i.id) for i in ctx.guild.roles if i.permissions.manage_guild]))
         server.election_managers = ",".join(guild_managers) + "," + ",".join(ids)
         await server.save()
+        internals.reads.invalidate(ctx.guild.id)
         await ctx.reply("Election manager roles set.")
 
     @set_election_managers.error
@@ -120,6 +122,7 @@ class Settings(commands.Cog):
             raise ValueError("Server settings not found. This is likely my own fault.")
         server.reward_roles = ",".join(ids)
         await server.save()
+        internals.reads.invalidate(ctx.guild.id)
         await ctx.reply("Reward roles set.")
 
     @set_reward_roles.error
@@ -163,6 +166,7 @@ class Settings(commands.Cog):
                 raise commands.errors.UserInputError("Please provide a number that is more than zero.")
         server.winners_pool = winners_pool
         await server.save()
+        internals.reads.invalidate(ctx.guild.id)
         await ctx.reply("Winners pool set.")
 
     @set_winners_count.error
@@ -230,6 +234,7 @@ class Settings(commands.Cog):
             raise ValueError("Server settings not found. This is likely my own fault.")
         server.role_weights = role_weights
         await server.save()
+        internals.reads.invalidate(ctx.guild.id)
         await ctx.reply("Role weights updated!")
 
     @set_role_weights.error
@@ -261,18 +266,37 @@ class Settings(commands.Cog):
         has_permission = await helpers.is_election_manager(ctx)
         if not has_permission:
             raise commands.errors.CheckFailure(message="You are not an election manager.")
-        server = await ServersSettings.filter(server_id=ctx.guild.id).first()
+        embed = await internals.reads.do(ctx.guild.id, "view-server-settings", lambda: self.settings_embed(ctx.guild))
+        await ctx.reply(embed=embed)
+
+    @view_server_settings.error
+    async def view_server_settings_error(self, ctx, error):
+        """
+        view-server-settings error handling.
+        Args: context, error
+        Return value: None
+        """
+        await ctx.reply(f"{error}")
+
+    @staticmethod
+    async def settings_embed(guild):
+        """
+        Build the server settings embed. Concurrent view-server-settings calls share one build.
+        Args: guild
+        Return value: embed
+        """
+        server = await internals.server_settings(guild.id)
         if not server:
             raise ValueError("Server settings not found. This is likely my own fault.")
         embed = discord.Embed(
             title="Server settings",
-            desc=f"Elections settings for {ctx.guild.name}",
+            description=f"Elections settings for {guild.name}",
             color=discord.Color.dark_blue(),
         )
         if not server.reward_roles:
             raise commands.errors.CheckFailure(message="Run `set-reward-roles` first.")
         roles = [
-            discord.utils.get(ctx.guild.roles, id=int(role_id)).name
+            discord.utils.get(guild.roles, id=int(role_id)).name
             for role_id in server.reward_roles.split(",")
         ]
         reward_roles = ",".join(roles)
@@ -283,24 +307,17 @@ class Settings(commands.Cog):
         embed.add_field(name="Winners pool", value=winner_pool_str)
         votes_cutoff_str = server.votes_cutoff if server.winner_selection_strategy == "cutoff" else "N/A"
         embed.add_field(name="Votes cutoff", value=votes_cutoff_str)
+        board_mode_str = "Buttons" if server.board_mode == "buttons" else "Reactions"
+        embed.add_field(name="Voting board", value=board_mode_str)
         if not server.role_weights:
             raise commands.errors.CheckFailure(message="Run `set-role-weights` first.")
         for i in server.role_weights:
-            role = discord.utils.get(ctx.guild.roles, id=int(i))
+            role = discord.utils.get(guild.roles, id=int(i))
             embed.add_field(
                 name=f"Votes available for users with the role {role}",
                 value=f"{server.role_weights[i]}",
             )
-        await ctx.reply(embed=embed)
-
-        @view_server_settings.error
-        async def view_server_settings_error(self, ctx, error):
-            """
-            view-server-settings error handling.
-            Args: context, error
-            Return value: None
-            """
-            await ctx.reply(f"{error}")
+        return embed
 
     @commands.command(name="set-winner-selection-strategy", help="Set whether to choose winners by maximum votes count or simply by a cutoff number.")
     @commands.guild_only()
@@ -321,6 +338,7 @@ class Settings(commands.Cog):
             raise ValueError("Server settings not found. This is likely my own fault.")
         server.winner_selection_strategy = strategy
         await server.save()
+        internals.reads.invalidate(ctx.guild.id)
         await ctx.reply("Winner selection strategy set.")
 
     @set_winner_selection_strategy.error
@@ -332,6 +350,40 @@ class Settings(commands.Cog):
         """
         await ctx.reply(f"{error}")
 
+    @commands.command(name="set-board-mode", help="Set whether members vote on new elections by reacting with emojis or by clicking buttons.")
+    @commands.guild_only()
+    async def set_board_mode(self, ctx, mode):
+        """
+        Set how voting boards of elections started from now on work: `reactions` puts an emoji per candidate
+        under the board, `buttons` puts a button per candidate on it and confirms every vote privately.
+        Args: mode of type str in ("reactions", "buttons")
+        Return value: None
+        """
+        has_permission = await helpers.is_election_manager(ctx)
+        if not has_permission:
+            raise commands.errors.CheckFailure(message="You are not an election manager.")
+        if mode not in ("reactions", "buttons"):
+            raise commands.errors.UserInputError("Incorrect board mode, only `reactions` or `buttons` allowed.")
+        server = await ServersSettings.filter(server_id=ctx.guild.id).first()
+        if not server:
+            raise ValueError("Server settings not found. This is likely my own fault.")
+        server.board_mode = mode
+        await server.save()
+        internals.reads.invalidate(ctx.guild.id)
+        await ctx.reply("Board mode set.")
+
+    @set_board_mode.error
+    async def set_board_mode_error(self, ctx, error):
+        """
+        set-board-mode error handling.
+        Args: context, error
+        Return value: None
+        """
+        if isinstance(error, commands.errors.MissingRequiredArgument):
+            await ctx.reply("Board mode required, either `reactions` or `buttons`.")
+        else:
+            await ctx.reply(f"{error}")
+
     @commands.command(name="set-votes-cutoff", help="Set the amount of votes that determine how much votes a member must amass to win an election if the `cutoff` strategy is used.")
     @commands.guild_only()
     async def set_votes_cutoff(self, ctx, *, cutoff):
@@ -357,6 +409,7 @@ class Settings(commands.Cog):
             raise commands.errors.UserInputError("The cutoff must be more than zero.")
         server.votes_cutoff = cutoff
         await server.save()
+        internals.reads.invalidate(ctx.guild.id)
         await ctx.reply("Votes cutoff set.")
 
     @set_votes_cutoff.error
@@ -369,4 +422,13 @@ class Settings(commands.Cog):
         if isinstance(error, commands.errors.MissingRequiredArgument):
             await ctx.reply("Cutoff required")
         else:
-            await ctx.reply(f"{error}")
\ No newline at end of file
+            await ctx.reply(f"{error}")
+
+
+async def setup(bot):
+    """
+    Extension entry point.
+    Args: bot object
+    Return value: None
+    """
+    await internals.setup_cog(bot, Settings, __name__)
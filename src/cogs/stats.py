@@ -0,0 +1,127 @@
+"""
+Cog defining commands for election analytics.
+"""
+import collections
+import datetime
+import math
+
+import discord
+from discord.ext import commands
+
+import src.analytics as analytics
+import src.helpers as helpers
+import src.internals as internals
+from src.db.db import ElectionRollups
+
+TURNOUT_ROWS = 20  # rows of the turnout chart, minutes are merged to fit
+BAR_WIDTH = 30  # characters of the longest turnout bar
+
+
+class Stats(commands.Cog):
+    """
+    Commands for election analytics.
+    """
+
+    def __init__(self, bot):
+        """
+        Initialize the cog.
+        Args: bot object
+        Return value: None
+        """
+        self.bot = bot
+
+    @commands.command(name="election-stats", help="View turnout over time and vote breakdowns for an election.")
+    @commands.guild_only()
+    async def election_stats(self, ctx, *, election_id):
+        """
+        Render an election's turnout over time, votes per candidate and per role from its rollups.
+        Works for finished elections too.
+        Args: election ID as type int
+        Return value: None
+        """
+        has_permission = await helpers.is_election_manager(ctx)
+        if not has_permission:
+            raise commands.errors.CheckFailure(message="You are not an election manager.")
+        try:
+            election_id = int(election_id)
+        except ValueError:
+            raise commands.errors.UserInputError("The election ID must be a number.")
+        await analytics.rollups.flush()  # include the last few seconds
+        rows = await ElectionRollups.filter(election_id=election_id, server_id=ctx.guild.id).order_by("minute").values(
+            "minute", "dimension", "subject_id", "delta", "events"
+        )
+        if not rows:
+            raise commands.errors.CommandError("No votes recorded for this election.")
+        voters = collections.Counter()  # dict: {minute: change in distinct voters}
+        totals = {"candidate": collections.Counter(), "role": collections.Counter()}
+        changes = 0
+        for row in rows:
+            if row["dimension"] == "voters":
+                voters[row["minute"]] += row["delta"]
+                changes += row["events"]
+            else:
+                totals[row["dimension"]][row["subject_id"]] += row["delta"]
+
+        embed = discord.Embed(
+            title=f"Election #{election_id}",
+            description=f"Statistics for election #{election_id}, {changes} ballot changes",
+            color=discord.Color.blue(),
+        )
+        embed.add_field(name="Turnout over time", value=f"```\n{self.turnout_chart(voters)}\n```", inline=False)
+        candidates = []
+        for candidate, votes in totals["candidate"].most_common():
+            user = await internals.members.get_user(candidate)
+            candidates.append(f"{user.name}: {votes}")
+        embed.add_field(name="Votes by candidate", value="\n".join(candidates)[:1024] or "None")
+        roles = [
+            f"{getattr(ctx.guild.get_role(role), 'name', role)}: {votes}"
+            for role, votes in totals["role"].most_common()
+        ]
+        embed.add_field(name="Votes by role", value="\n".join(roles)[:1024] or "None")
+        await ctx.reply(embed=embed)
+
+    @staticmethod
+    def turnout_chart(voters):
+        """
+        Draw cumulative distinct voters as a text bar chart.
+        Args: {minute: change in distinct voters}
+        Return value: chart of type str
+        """
+        first, last = min(voters), max(voters)
+        step = max(1, math.ceil((last - first + 1) / TURNOUT_ROWS))  # minutes per row
+        changes = collections.Counter()  # dict: {row: change in distinct voters}
+        for minute, delta in voters.items():
+            changes[(minute - first) // step] += delta
+        series = []
+        turnout = 0
+        for row in range((last - first) // step + 1):
+            turnout += changes[row]
+            series.append((first + row * step, turnout))
+        peak = max(max(i[1] for i in series), 1)
+        return "\n".join(
+            f"{datetime.datetime.fromtimestamp(start * 60):%m-%d %H:%M} {'#' * round(BAR_WIDTH * count / peak):<{BAR_WIDTH}} {count}"
+            for start, count in series
+        )
+
+    @election_stats.error
+    async def election_stats_error(self, ctx, error):
+        """
+        election-stats error handling.
+        Args: context, error
+        Return value: None
+        """
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.reply(
+                "Please specify an election ID. Use `view-current-elections` to see which elections are in progress."
+            )
+        else:
+            await ctx.reply(error)
+
+
+async def setup(bot):
+    """
+    Extension entry point.
+    Args: bot object
+    Return value: None
+    """
+    await internals.setup_cog(bot, Stats, __name__)
@@ -4,6 +4,8 @@ A cogs for miscellaneous commands (namely, `ping`)
 from discord.ext import commands
 
 import src.internals as internals
+import src.metrics as metrics
+import src.watchdog as watchdog
 
 
 class Technical(commands.Cog):
@@ -22,12 +24,32 @@ class Technical(commands.Cog):
     @commands.command(name="ping", help="Get bot latency")
     async def ping(self, ctx):
         """
-        Get bot latency
+        Get bot latency, and the event loop's lag with the last time it stalled.
         Args: None except context
         Return value: None
         """
-        await ctx.send(f"Latency: {round(internals.bot.latency * 1000)} ms")
+        monitor = watchdog.monitor
+        lines = [
+            f"Latency: {round(internals.bot.latency * 1000)} ms",
+            f"Event loop lag: {round(monitor.lag * 1000)} ms (max {round(monitor.max_lag * 1000)} ms), "
+            f"{metrics.counters['watchdog.stalls']} stalls over {round(monitor.threshold * 1000)} ms since startup",
+        ]
+        if monitor.stalls:
+            stall = monitor.stalls[-1]
+            where = stall["stack"][-1].strip().splitlines()[0] if stall["stack"] else "unknown"
+            lines.append(f"Last stall: {round(stall['lag'] * 1000)} ms at {stall['at']:%H:%M:%S} in {stall['task']}, {where}")
+        await ctx.send("\n".join(lines))
 
     @ping.error
     async def ping_error(self, ctx, error):
         await ctx.reply(f"{error}")
+
+
+
+async def setup(bot):
+    """
+    Extension entry point.
+    Args: bot object
+    Return value: None
+    """
+    await internals.setup_cog(bot, Technical, __name__)
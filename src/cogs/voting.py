@@ -1,16 +1,42 @@
 """
 Cog defining commands for managing elections.
 """
-import operator
+import asyncio
+import collections
+import contextlib
 import datetime
-import itertools
 
 import discord
 from discord.ext import commands
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
 
+import src.analytics as analytics
 import src.helpers as helpers
 import src.internals as internals
-from src.db.db import Elections, ServersSettings
+import src.leaderboard as leaderboard
+import src.log as log
+import src.metrics as metrics
+import src.tally as tally
+import src.throttle as throttle
+from src.db.db import ElectionBallots, ElectionBoards, Elections, ServersSettings, election_ballots, elections_page
+
+ELECTIONS_PAGE_SIZE = 10  # embeds are capped at 25 fields
+EMBED_FIELDS = 25  # fields per embed
+EMBEDS_PER_MESSAGE = 10
+PREVIOUS_PAGE = "\u2b05\ufe0f"
+NEXT_PAGE = "\u27a1\ufe0f"
+PAGINATION_TIMEOUT = 120  # seconds of inactivity before the page buttons stop working
+VOTE_BUTTON_PREFIX = "vote:"  # button custom_id is "vote:{election_id}:{candidate_id}"
+MAX_BUTTONS = 25  # 5 action rows of 5 buttons, per board message
+MAX_REACTIONS = 20  # distinct reactions per message, so candidates per reaction board message
+LEADERBOARD_SIZE = 10  # candidates shown by the leaderboard command by default
+SIMULATED_SETTINGS = 10  # pools and cutoffs simulate-election takes at most, each
+SIMULATED_NAMES = 5  # winners named per simulated setting
+BOARD_REFRESH = 5.0  # seconds; a button board's tallies are redrawn at most once per this
+VOTE_ACK_TIMEOUT = 2.0  # seconds to wait for a vote to be written before acknowledging it anyway
+logger = log.get_logger("voting")
+votes_logger = log.get_logger("votes")  # one record per vote, sampled
 
 
 class Voting(commands.Cog):
@@ -20,6 +46,26 @@ class Voting(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.tally_versions = collections.defaultdict(int)  # dict: {election_id: version}, bumped on every vote change
+        self.poll_embeds = {}  # dict: {election_id: (server_id, tally version, embeds)}
+        self.candidate_names = {}  # dict: {user_id: "name#discriminator"}
+        self.throttle = throttle.ReactionThrottle(self._apply_vote)
+        self.guild_locks = collections.defaultdict(asyncio.Lock)  # dict: {guild_id: lock}, serializes vote writes
+        self.board_refreshes = {}  # dict: {(election_id, message_id): asyncio.TimerHandle}, pending button board redraws
+        self.board_index = {}  # dict: {message_id: (election_id, [candidate_id], {emoji_id: candidate_id})}, see board_entry
+        self.leaderboards = {}  # dict: {election_id: Leaderboard}, updated with every vote change
+        self.voter_ballots = {}  # dict: {election_id: {voter_id: ballots}}, loaded on an election's first vote
+
+    def cog_unload(self):
+        """
+        Write out throttled votes before the cog goes away.
+        Args: None
+        Return value: None
+        """
+        self.throttle.flush_all()
+        for timer in self.board_refreshes.values():
+            timer.cancel()
+        asyncio.ensure_future(analytics.rollups.flush())
 
     @commands.command(name="start-election", help="Start an election in current server.")
     @commands.guild_only()
@@ -42,40 +88,169 @@ class Voting(commands.Cog):
                 "Please check if you haven't selected a role/channel as a candidate. Only users are supported."
             )
         ids = await helpers.get_mention_ids(candidates)
-        is_bot = [internals.bot.get_user(int(i)).bot for i in ids]
+        for member in ctx.message.mentions:
+            internals.members.remember(member)  # saves fetching them again in the lean member-cache mode
+        try:
+            members = {i: await internals.members.get_member(ctx.guild, int(i)) for i in ids}
+        except discord.errors.NotFound:
+            raise commands.errors.UserInputError("Please check if all the candidates are members of this server.")
+        is_bot = [i.bot for i in members.values()]
         if True in is_bot:
             raise commands.errors.UserInputError(
                 "Please check if you haven't selected a bot as a candidate. Machines don't have voting rights... yet."
             )
-        election_id = len(await Elections.all()) + 1
-        emoji_ids = [i.id for i in ctx.guild.emojis]
-        candidates_votes = dict(zip(ids, zip(emoji_ids, [0 for i in ids])))
-        await Elections.create(
+        if server.board_mode == "buttons":
+            await self.start_button_election(ctx, ids)
+            return
+        emojis = ctx.guild.emojis[:MAX_REACTIONS]
+        if not emojis:
+            raise commands.errors.UserInputError(
+                "This server has no custom emojis to vote with. Add some, or use `set-board-mode buttons`."
+            )
+        pages = [ids[i:i + len(emojis)] for i in range(0, len(ids), len(emojis))]  # every page reuses the emojis
+        candidates_votes = {candidate: [emojis[j].id, 0] for page in pages for j, candidate in enumerate(page)}
+        election = await Elections.create(
             server_id=ctx.guild.id,
-            id=election_id,
+            channel_id=ctx.channel.id,
             candidates_votes=candidates_votes,
             timestamp=datetime.datetime.now(),
         )
-        election = await Elections.filter(id=election_id).first()
+        internals.reads.invalidate(ctx.guild.id, "view-current-elections")
+        election_id = election.id
+        await ctx.reply(f"Election #{election_id} started in {ctx.guild.name}")
+        messages = []
+        number = 0
+        for position, page in enumerate(pages):
+            embed = discord.Embed(
+                title=f"Election #{election_id}",
+                description=f"Voting sheet for election #{election_id} in {ctx.guild.name}",
+                color=discord.Color.blue(),
+            )
+            for emoji, candidate in zip(emojis, page):
+                number += 1
+                embed.add_field(name=f"Candidate #{number}", value=f"{emoji}:{members[candidate].name}")
+            if len(pages) > 1:
+                embed.set_footer(text=f"Page {position + 1} of {len(pages)}")
+            messages.append(await ctx.reply(embed=embed))
+        await self.save_board(election, messages, [{candidate: emoji.id for emoji, candidate in zip(emojis, page)} for page in pages])
+        await messages[0].pin(reason="Pinning an election voting board.")
+        await asyncio.gather(*(self.add_reactions(message, emojis[:len(page)]) for message, page in zip(messages, pages)))
+
+    async def save_board(self, election, messages, candidates):
+        """
+        Record the messages of a new voting board and index them for the vote path.
+        Called before any reaction is added, so that early votes are not dropped.
+        Args: election, board messages in order, {candidate_id: emoji_id (None on button boards)} for every message
+        Return value: None
+        """
+        election.progress_message = messages[0].id
+        await election.save()
+        await ElectionBoards.bulk_create(
+            [
+                ElectionBoards(election_id=election.id, message_id=message.id, position=position, candidates=page)
+                for position, (message, page) in enumerate(zip(messages, candidates))
+            ]
+        )
+        for message, page in zip(messages, candidates):
+            self.index_board(election.id, message.id, page)
+
+    def index_board(self, election_id, message_id, candidates):
+        """
+        Remember which candidates a board message holds.
+        Args: election id, message id, {candidate_id: emoji_id}
+        Return value: (election_id, [candidate_id], {emoji_id: candidate_id}), candidate ids as type str
+        """
+        entry = self.board_index[message_id] = (
+            election_id,
+            [str(i) for i in candidates],
+            {emoji: str(candidate) for candidate, emoji in candidates.items() if emoji is not None},
+        )
+        return entry
+
+    async def board_entry(self, message_id):
+        """
+        Look up a board message, from the index or else the database.
+        Args: message id
+        Return value: (election_id, [candidate_id], {emoji_id: candidate_id}), None if it is not a voting board
+        """
+        entry = self.board_index.get(message_id)
+        if entry is None:
+            board = await ElectionBoards.filter(message_id=message_id).first()
+            if board is None:
+                return None
+            entry = self.index_board(board.election_id, message_id, board.candidates)
+        return entry
+
+    @staticmethod
+    async def add_reactions(message, emojis):
+        """
+        Add the voting emojis under a board message, in order. The messages of a board get theirs in parallel.
+        Args: message, emojis
+        Return value: None
+        """
+        for emoji in emojis:
+            await message.add_reaction(emoji)
+
+    async def start_button_election(self, ctx, ids):
+        """
+        Start an election whose voting board has a button per candidate instead of reactions.
+        Each board message is sent in one request, votes arrive as interactions (see on_interaction).
+        Args: context, candidate ids
+        Return value: None
+        """
+        election = await Elections.create(
+            server_id=ctx.guild.id,
+            channel_id=ctx.channel.id,
+            candidates_votes={str(i): [None, 0] for i in ids},
+            timestamp=datetime.datetime.now(),
+        )
+        internals.reads.invalidate(ctx.guild.id, "view-current-elections")
+        await ctx.reply(f"Election #{election.id} started in {ctx.guild.name}")
+        pages = [[str(i) for i in ids[j:j + MAX_BUTTONS]] for j in range(0, len(ids), MAX_BUTTONS)]
+        messages = []
+        for page in pages:
+            messages.append(
+                await ctx.reply(
+                    embed=await self.board_embed(ctx.guild, election, page),
+                    view=await self.board_view(ctx.guild, election, page),
+                )
+            )
+        await self.save_board(election, messages, [dict.fromkeys(page) for page in pages])
+        await messages[0].pin(reason="Pinning an election voting board.")
+
+    async def board_embed(self, guild, election, candidates):
+        """
+        Build a button board message's embed with the current tallies.
+        Args: guild, election, ids of the candidates on the message
+        Return value: embed
+        """
         embed = discord.Embed(
-            title=f"Election #{election_id}",
-            desc=f"Voting sheet for election #{election_id} in {ctx.guild.name}",
+            title=f"Election #{election.id}",
+            description=f"Voting sheet for election #{election.id} in {guild.name}. Click a button to vote, again to retract.",
             color=discord.Color.blue(),
         )
-        candidates = (await Elections.filter(id=election_id).first()).candidates_votes
-        names = [
-            internals.bot.get_user(int(i)).name for i in candidates.keys()
-        ]  # int cast required for the method to work
-        embed_data = dict(zip(ctx.guild.emojis, names))
-        for i, name in enumerate(embed_data):
-            embed.add_field(name=f"Candidate #{i+1}", value=f"{name}:{embed_data[name]}")
-        await ctx.reply(f"Election #{election_id} started in {ctx.guild.name}")
-        message = await ctx.reply(embed=embed)
-        await message.pin(reason="Pinning an election voting board.")
-        for emoji in embed_data:
-            await message.add_reaction(emoji)
-        election.progress_message = message.id
-        await election.save()
+        on_message = set(candidates)
+        for i, (candidate, (_, votes)) in enumerate(election.candidates_votes.items()):
+            if candidate in on_message:
+                embed.add_field(name=f"Candidate #{i+1}", value=f"{await self.candidate_name(guild, int(candidate))}: {votes}")
+        return embed
+
+    async def board_view(self, guild, election, candidates):
+        """
+        Build a button board message's buttons, one per candidate.
+        Args: guild, election, ids of the candidates on the message
+        Return value: view
+        """
+        view = discord.ui.View(timeout=None)
+        for candidate in candidates:
+            view.add_item(
+                discord.ui.Button(
+                    label=(await self.candidate_name(guild, int(candidate)))[:80],
+                    custom_id=f"{VOTE_BUTTON_PREFIX}{election.id}:{candidate}",
+                )
+            )
+        view.stop()  # clicks are handled in on_interaction, so the view does not need to be kept around
+        return view
 
     @start_election.error
     async def start_election_error(self, ctx, error):
@@ -96,26 +271,83 @@ class Voting(commands.Cog):
     async def view_current_elections(self, ctx):
         """
         View which elections are ongoing in this server as a Rich embed.
+        The list is paged, react with the arrows to move between pages.
         Args: none except context
         Return value: None
         """
         has_permission = await helpers.is_election_manager(ctx)
         if not has_permission:
             raise commands.errors.CheckFailure(message="You are not an election manager.")
-        elections = list(await Elections.filter(server_id=ctx.guild.id).all())
+        page = 1
+        elections, has_next = await internals.reads.do(
+            ctx.guild.id, "view-current-elections", lambda: elections_page(ctx.guild.id, limit=ELECTIONS_PAGE_SIZE)
+        )  # the first page is shared by concurrent calls, later pages are per user
+        has_previous = False
+        message = await ctx.reply(embed=self.elections_embed(ctx.guild, elections, page))
+        if not has_next:
+            return
+        for emoji in (PREVIOUS_PAGE, NEXT_PAGE):
+            await message.add_reaction(emoji)
+
+        def check(payload):
+            return (
+                payload.message_id == message.id
+                and payload.user_id == ctx.author.id
+                and str(payload.emoji) in (PREVIOUS_PAGE, NEXT_PAGE)
+            )
+
+        while True:
+            try:
+                payload = await self.bot.wait_for("raw_reaction_add", check=check, timeout=PAGINATION_TIMEOUT)
+            except asyncio.TimeoutError:
+                return
+            try:
+                await message.remove_reaction(payload.emoji, payload.member)
+            except discord.errors.HTTPException:
+                pass  # no Manage Messages permission, the user will have to unreact themselves
+            if str(payload.emoji) == NEXT_PAGE and has_next:
+                last = elections[-1]
+                elections, has_next = await elections_page(
+                    ctx.guild.id, after=(last.timestamp, last.id), limit=ELECTIONS_PAGE_SIZE
+                )
+                has_previous = True
+                page += 1
+            elif str(payload.emoji) == PREVIOUS_PAGE and has_previous:
+                first = elections[0]
+                elections, has_previous = await elections_page(
+                    ctx.guild.id, before=(first.timestamp, first.id), limit=ELECTIONS_PAGE_SIZE
+                )
+                has_next = True
+                page -= 1
+            else:
+                continue
+            if not elections:  # the rest of the list was finished meanwhile, start over
+                elections, has_next = await elections_page(ctx.guild.id, limit=ELECTIONS_PAGE_SIZE)
+                has_previous = False
+                page = 1
+            await message.edit(embed=self.elections_embed(ctx.guild, elections, page))
+
+    @staticmethod
+    def elections_embed(guild, elections, page):
+        """
+        Build one page of the ongoing elections list.
+        Args: guild, list of Elections on the page, page number
+        Return value: embed
+        """
         embed = discord.Embed(
             title="Ongoing elections",
-            description=f"List of elections currently in progress in {ctx.guild.name}",
+            description=f"List of elections currently in progress in {guild.name}",
             color=discord.Color.blue(),
         )
         for i in elections:
             embed.add_field(name=f"Election #{i.id}", value=f"initiated at {i.timestamp}")
-        if not elections:
+        if not elections and page == 1:
             embed.add_field(
                 name="Elections in progress:",
                 value="None. You're way too authoritarian for those pesky things.",
             )
-        await ctx.reply(embed=embed)
+        embed.set_footer(text=f"Page {page}")
+        return embed
 
     @commands.command(name="view-election-poll", help="View the current polls for an election.")
     @commands.guild_only()
@@ -129,25 +361,105 @@ class Voting(commands.Cog):
         if not has_permission:
             raise commands.errors.CheckFailure(message="You are not an election manager.")
         try:
-            election = await Elections.filter(id=election_id).first()
-        except Exception:
-            election = None
+            election_id = int(election_id)
+        except ValueError:
+            raise commands.errors.UserInputError("The election ID must be a number.")
+        version = self.tally_versions.get(election_id, 0)
+        cached = self.poll_embeds.get(election_id)
+        if cached and cached[0] == ctx.guild.id and cached[1] == version:
+            embeds = cached[2]
+        else:
+            # the version is part of the key, so a build started before a vote is not shared after it
+            embeds = await internals.reads.do(
+                ctx.guild.id,
+                ("view-election-poll", election_id, version),
+                lambda: self.build_poll(ctx.guild, election_id, version),
+            )
+        await ctx.reply(embeds=embeds[:EMBEDS_PER_MESSAGE])
+        for i in range(EMBEDS_PER_MESSAGE, len(embeds), EMBEDS_PER_MESSAGE):
+            await ctx.send(embeds=embeds[i:i + EMBEDS_PER_MESSAGE])
+
+    async def build_poll(self, guild, election_id, version):
+        """
+        Build an election's poll, an embed per EMBED_FIELDS candidates, and cache it with the tally version it
+        was built from. Concurrent view-election-poll misses share one build through internals.reads.
+        Args: guild, election id of type int, tally version taken before reading the election
+        Return value: list of embeds
+        """
+        election = await Elections.filter(id=election_id, server_id=guild.id).first()
         if election is None:
             raise commands.errors.CommandError("No such election exists.")
         election_candidates = election.candidates_votes
-        embed = discord.Embed(
-            title=f"Election #{election_id}",
-            desc=f"Polls for election #{election_id} at {datetime.datetime.now()}",
-            color=discord.Color.blue(),
-        )
-        for i in election_candidates:
-            name = (
-                internals.bot.get_user(int(i)).name
-                + "#"
-                + internals.bot.get_user(int(i)).discriminator
-            )  # int cast required for the methods to work
-            embed.add_field(name=name, value=election_candidates[i][1])
-        await ctx.reply(embed=embed)
+        embeds = []
+        for number, i in enumerate(election_candidates):
+            if number % EMBED_FIELDS == 0:
+                embeds.append(
+                    discord.Embed(
+                        title=f"Election #{election_id}",
+                        description=f"Polls for election #{election_id} at {datetime.datetime.now()}",
+                        color=discord.Color.blue(),
+                    )
+                )
+            embeds[-1].add_field(name=await self.candidate_name(guild, int(i)), value=election_candidates[i][1])
+        if self.tally_versions.get(election_id, 0) == version:  # a vote landing meanwhile makes it stale
+            self.poll_embeds[election_id] = (guild.id, version, embeds)
+        return embeds
+
+    async def candidate_name(self, guild, user_id):
+        """
+        Get a candidate's name#discriminator, cached for the lifetime of the cog.
+        Args: guild, user id of type int
+        Return value: name of type str
+        """
+        name = self.candidate_names.get(user_id)
+        if name is None:
+            try:
+                user = await internals.members.get_member(guild, user_id)
+            except discord.errors.NotFound:
+                user = await internals.members.get_user(user_id)  # the candidate has left the server
+            name = self.candidate_names[user_id] = f"{user.name}#{user.discriminator}"
+        return name
+
+    def forget_election(self, election_id):
+        """
+        Drop everything cached about an election that no longer exists.
+        Args: election id of type int
+        Return value: None
+        """
+        self.leaderboards.pop(election_id, None)
+        self.tally_versions.pop(election_id, None)
+        self.poll_embeds.pop(election_id, None)
+        self.voter_ballots.pop(election_id, None)
+        for key in [i for i in self.board_refreshes if i[0] == election_id]:
+            self.board_refreshes.pop(key).cancel()
+        for message_id in [i for i, entry in self.board_index.items() if entry[0] == election_id]:
+            del self.board_index[message_id]
+
+    def tally_changed(self, election, candidates):
+        """
+        Invalidate the cached poll of an election and move candidates on its leaderboard after its tally changed.
+        Args: election, keys of the candidates whose votes changed
+        Return value: None
+        """
+        internals.reads.invalidate(election.server_id, ("view-election-poll", election.id, self.tally_versions[election.id]))
+        self.tally_versions[election.id] += 1
+        board = self.leaderboards.get(election.id)
+        if board is not None:
+            for i in candidates:
+                board.update(i, election.candidates_votes[i][1])
+
+    def leaderboard(self, election):
+        """
+        Get an election's leaderboard, built from the stored tally the first time it is needed.
+        Must be called under the guild's lock with the election read under it too, so that no vote
+        lands between reading the tally and building the board from it.
+        Args: election
+        Return value: Leaderboard
+        """
+        board = self.leaderboards.get(election.id)
+        if board is None:
+            board = self.leaderboards[election.id] = leaderboard.Leaderboard(election.candidates_votes)
+        return board
 
     @view_election_poll.error
     async def view_election_poll_error(self, ctx, error):
@@ -181,39 +493,55 @@ class Voting(commands.Cog):
         ).first()
         if not server:
             raise ValueError("Server settings not found. This is likely my own fault.")
-        winners_cutoff = server.winners_pool if server.winner_selection_strategy == "max_votes" else None
-        try:
-            election = await Elections.filter(id=election_id).first()
-        except Exception:
-            election = None
-        if not election:
-            raise commands.errors.CommandError("No such election exists.")
-        candidates_votes = election.candidates_votes
-        votes_dict = dict(zip(candidates_votes.keys(), [i[1] for i in candidates_votes.values()]))
-        votes_sorted = dict(sorted(votes_dict.items(), key=lambda item: item[1], reverse=True))
-        print(votes_sorted)
-        print(winners_cutoff)
-        if winners_cutoff:
-            voting = dict(itertools.islice(votes_sorted.items(), winners_cutoff))
-        else:
-            print(f"cut_off by votes")
-            voting = {candidate: votes for candidate, votes in votes_sorted.items() if votes >= server.votes_cutoff}
+        async with self.guild_locks[ctx.guild.id]:  # no vote lands between reading the winners and the delete
+            try:
+                election = await Elections.filter(id=election_id, server_id=ctx.guild.id).first()
+            except Exception:
+                election = None
+            if not election:
+                raise commands.errors.CommandError("No such election exists.")
+            if election.progress_message is None:
+                raise commands.errors.UserInputError("This election has no voting board yet.")
+            election_message = await ctx.fetch_message(int(election.progress_message))
+            if not election_message:
+                raise commands.errors.UserInputError("Election voting board not found. Maybe the election is ongoing in some other channel?")
+            voting = dict(self.leaderboard(election).winners(server))
+            logger.debug("Final tally", extra=log.fields(election_id=election.id, votes=election.candidates_votes))
+            pages = await ElectionBoards.filter(election_id=election.id, position__gt=0).values_list("message_id", flat=True)
+            async with in_transaction():
+                await ElectionBoards.filter(election_id=election.id).delete()
+                await ElectionBallots.filter(election_id=election.id).delete()
+                await election.delete()
+            self.forget_election(election.id)
         reward_roles = [
             discord.utils.get(ctx.guild.roles, id=int(role_id))
             for role_id in server.reward_roles.split(",")
         ]
         for i in voting.keys():
-            winner = ctx.guild.get_member(int(i))
+            winner = await internals.members.get_member(ctx.guild, int(i))
             await winner.add_roles(*reward_roles, reason=f"Won election #{election_id}")
         mentions = ", ".join([await helpers.get_user_mention_by_id(i) for i in voting])
-        election_message = await ctx.fetch_message(int(election.progress_message))
-        if not election_message:
-            raise commands.errors.UserInputError("Election voting board not found. Maybe the election is ongoing in some other channel?")
         await election_message.unpin(reason="Removing an election voting board")
         await election_message.delete()
-        await election.delete()
+        await asyncio.gather(*(self.delete_board_message(ctx.channel, i) for i in pages))
+        internals.reads.invalidate(ctx.guild.id, "view-current-elections")
+        logger.info(
+            "Election finished", extra=log.fields(election_id=election.id, guild_id=ctx.guild.id, winners=list(voting))
+        )
         await ctx.reply(f"Election {election_id} finished. Winners: {mentions}")
 
+    @staticmethod
+    async def delete_board_message(channel, message_id):
+        """
+        Delete one of the further messages of a voting board, if it is still there.
+        Args: channel, message id
+        Return value: None
+        """
+        try:
+            await channel.get_partial_message(message_id).delete()
+        except discord.errors.NotFound:
+            pass
+
     @finish_election.error
     async def finish_election_error(self, ctx, error):
         """
@@ -228,40 +556,160 @@ class Voting(commands.Cog):
         else:
             await ctx.reply(error)
 
+    @commands.command(name="leaderboard", help="View the leading candidates of an election and who would win now.")
+    @commands.guild_only()
+    async def leaderboard_command(self, ctx, election_id, count=LEADERBOARD_SIZE):
+        """
+        Show the top candidates of an election and the winners if it finished now.
+        Args: election ID as type int, number of candidates to show as type int
+        Return value: None
+        """
+        has_permission = await helpers.is_election_manager(ctx)
+        if not has_permission:
+            raise commands.errors.CheckFailure(message="You are not an election manager.")
+        try:
+            election_id, count = int(election_id), int(count)
+        except ValueError:
+            raise commands.errors.UserInputError("The election ID and the number of candidates must be numbers.")
+        if count <= 0:
+            raise commands.errors.UserInputError("The number of candidates must be positive.")
+        server = await ServersSettings.filter(server_id=ctx.guild.id).first()
+        async with self.guild_locks[ctx.guild.id]:
+            election = await Elections.filter(id=election_id, server_id=ctx.guild.id).first()
+            if election is None:
+                raise commands.errors.CommandError("No such election exists.")
+            board = self.leaderboard(election)
+            total, top, winners = len(board), board.top(count), board.winners(server)
+        embed = discord.Embed(
+            title=f"Election #{election_id}",
+            description=f"Top {min(count, total)} of {total} candidates at {datetime.datetime.now()}",
+            color=discord.Color.blue(),
+        )
+        leaders = [
+            f"{place}. {await self.candidate_name(ctx.guild, int(candidate))}: {votes}"
+            for place, (candidate, votes) in enumerate(top, 1)
+        ]
+        embed.add_field(name="Leaders", value="\n".join(leaders)[:1024], inline=False)
+        winners = [await self.candidate_name(ctx.guild, int(candidate)) for candidate, _ in winners]
+        embed.add_field(name="Winners if finished now", value=", ".join(winners)[:1024] or "None", inline=False)
+        await ctx.reply(embed=embed)
+
+    @leaderboard_command.error
+    async def leaderboard_error(self, ctx, error):
+        """
+        leaderboard error handling.
+        Args: context, error
+        Return value: None
+        """
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.reply(
+                "Please specify an election ID. Use `view-current-elections` to see which elections are in progress."
+            )
+        else:
+            await ctx.reply(error)
+
+    @commands.command(
+        name="simulate-election",
+        help="Show who would win an election under other winners_pool and votes_cutoff settings. "
+        "Both lists are comma-separated, e.g. `simulate-election 4 1,2,3 0,10,25`.",
+    )
+    @commands.guild_only()
+    async def simulate_election(self, ctx, election_id, winners_pools=None, votes_cutoffs=None):
+        """
+        Recount an election from its ballots and show its winners for several winners_pool and votes_cutoff values.
+        By default the server's own values are tried alongside a few common pools and the tally's quartiles.
+        Args: election ID as type int, winners_pool values and votes_cutoff values as comma-separated ints
+        Return value: None
+        """
+        has_permission = await helpers.is_election_manager(ctx)
+        if not has_permission:
+            raise commands.errors.CheckFailure(message="You are not an election manager.")
+        try:
+            election_id = int(election_id)
+            pools = [int(i) for i in winners_pools.split(",")] if winners_pools else []
+            cutoffs = [int(i) for i in votes_cutoffs.split(",")] if votes_cutoffs else []
+        except ValueError:
+            raise commands.errors.UserInputError(
+                "The election ID must be a number, and the pools and cutoffs comma-separated numbers."
+            )
+        if any(i < 0 for i in pools + cutoffs):
+            raise commands.errors.UserInputError("Pools and cutoffs can't be negative.")
+        if len(pools) > SIMULATED_SETTINGS or len(cutoffs) > SIMULATED_SETTINGS:
+            raise commands.errors.UserInputError(f"Up to {SIMULATED_SETTINGS} pools and cutoffs can be simulated at once.")
+        election = await Elections.filter(id=election_id, server_id=ctx.guild.id).first()
+        if election is None:
+            raise commands.errors.CommandError("No such election exists.")
+        server = await internals.server_settings(ctx.guild.id)
+        rows = await election_ballots(election.id)
+        ballots = await asyncio.to_thread(tally.Ballots.from_rows, list(election.candidates_votes), rows)
+        recount = ballots.totals()
+        stored = tally.stored_totals(election)
+        outcomes = tally.Outcomes(stored)  # what finish-election would go by
+        if not pools:
+            pools = sorted({1, 2, 3, 5, 10, server.winners_pool} - {0})
+        if not cutoffs:
+            cutoffs = sorted({server.votes_cutoff, *outcomes.quartiles()})
+
+        differing = int((recount != stored).sum())
+        if differing:
+            recount_note = (
+                f"The recount of {len(ballots)} ballots differs from the tally for {differing} candidates "
+                "(votes cast before ballots were kept), results below go by the tally."
+            )
+        else:
+            recount_note = f"The recount of {len(ballots)} ballots from {ballots.voter_count()} voters matches the tally."
+        current = outcomes.count(server.winner_selection_strategy, server.winners_pool, server.votes_cutoff)
+        embed = discord.Embed(
+            title=f"Election #{election_id}",
+            description=f"Now: {server.winner_selection_strategy}, winners_pool {server.winners_pool}, "
+            f"votes_cutoff {server.votes_cutoff}: {current} winners.\n{recount_note}",
+            color=discord.Color.blue(),
+        )
+        for name, values, counts in (
+            ("max_votes with winners_pool", pools, outcomes.pools(pools)),
+            ("cutoff with votes_cutoff", cutoffs, outcomes.cutoffs(cutoffs)),
+        ):
+            lines = []
+            for value, count in zip(values, counts):
+                shown = [
+                    await self.candidate_name(ctx.guild, int(ballots.candidates[i]))
+                    for i in outcomes.winners(min(count, SIMULATED_NAMES))
+                ]
+                more = f" and {count - len(shown)} more" if count > len(shown) else ""
+                tie = ", tied with the next candidate" if outcomes.tied_at_edge(count) else ""
+                lines.append(f"**{value}**: {count} winners{tie}. {', '.join(shown)}{more}")
+            embed.add_field(name=name, value="\n".join(lines)[:1024] or "None", inline=False)
+        await ctx.reply(embed=embed)
+
+    @simulate_election.error
+    async def simulate_election_error(self, ctx, error):
+        """
+        simulate-election error handling.
+        Args: context, error
+        Return value: None
+        """
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.reply(
+                "Please specify an election ID. Use `view-current-elections` to see which elections are in progress."
+            )
+        else:
+            await ctx.reply(error)
+
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
         """
         Listener that captures reactions and counts them as votes.
+        The vote is handed to the throttle, which writes it out in _apply_vote.
         Args: none except payload (a Discord structure)
         Return value: None
         """
-        user = internals.bot.get_user(int(payload.user_id))
-        if user.bot:
-            return  # machines can't vote
-        progress_messages = [
-            i.progress_message for i in (await Elections.filter(server_id=payload.guild_id))
-        ]
-        if not payload.message_id in progress_messages:
-            return  # not an election message
-        election = await Elections.filter(progress_message=payload.message_id).first()
-        server = await ServersSettings.filter(server_id=payload.guild_id).first()
-        candidates_votes = election.candidates_votes
-        if payload.member.id in candidates_votes.keys():
-            return # cannot vote for oneself
-        for i in candidates_votes:
-            weights = [
-                (i, server.role_weights[str(i)])
-                for i in (
-                    set([i.id for i in payload.member.roles])
-                    & set([int(i) for i in server.role_weights.keys()])
-                )
-            ]
-            weights = sorted(weights, key=operator.itemgetter(1), reverse=True)
-            if candidates_votes[i][0] == payload.emoji.id and weights:
-                candidates_votes[i][1] += weights[0][1]
-
-        election.candidates_votes = candidates_votes
-        await election.save()
+        if payload.guild_id is None or payload.emoji.id is None:
+            return  # voting boards only use custom emojis
+        if payload.member is not None:
+            if payload.member.bot:
+                return  # machines can't vote
+            internals.members.remember(payload.member)  # the removal event comes without it
+        self.throttle.submit(payload.guild_id, payload.user_id, payload.message_id, payload.emoji.id, 1)
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload):
@@ -270,31 +718,247 @@ class Voting(commands.Cog):
         Args: none except payload (a Discord structure)
         Return value: None
         """
-        user = internals.bot.get_user(int(payload.user_id))
-        guild = await self.bot.fetch_guild(payload.guild_id)
-        if user.bot:
-            return  # machines can't vote
-        progress_messages = [
-            i.progress_message for i in (await Elections.filter(server_id=payload.guild_id))
-        ]
-        if not payload.message_id in progress_messages:
-            return  # not an election message
-        election = await Elections.filter(progress_message=payload.message_id).first()
-        server = await ServersSettings.filter(server_id=payload.guild_id).first()
-        candidates_votes = election.candidates_votes
-        member = guild.fetch_member(payload.user_id)
-        if member.id in candidates_votes.keys():
-            return # cannot remove vote for oneself since one cannot vote for oneself
-        for i in candidates_votes:
-            weights = [
-                (i, server.role_weights[str(i)])
-                for i in (
-                    set([i.id for i in member.roles])
-                    & set([int(i) for i in server.role_weights.keys()])
-                )
-            ]
-            weights = sorted(weights, key=operator.itemgetter(1), reverse=True)
-            if candidates_votes[i][0] == payload.emoji.id and weights:
-                candidates_votes[i][1] -= weights[0][1]
-        election.candidates_votes = candidates_votes
-        await election.save()
+        if payload.guild_id is None or payload.emoji.id is None:
+            return  # voting boards only use custom emojis
+        self.throttle.submit(payload.guild_id, payload.user_id, payload.message_id, payload.emoji.id, -1)
+
+    async def _apply_vote(self, guild_id, user_id, message_id, emoji_id, delta):
+        """
+        Add (delta=1) or retract (delta=-1) a member's vote, weighted by their heaviest role.
+        Votes in the same guild are applied one at a time, so none of them get lost.
+        Args: guild id, voter id, board message id, emoji id, delta
+        Return value: None
+        """
+        async with self.guild_locks[guild_id]:
+            board = await self.board_entry(message_id)
+            if board is None:
+                return  # not an election message
+            candidate = board[2].get(emoji_id)
+            if candidate is None:
+                return  # not one of the message's voting emojis
+            election = await Elections.filter(id=board[0], server_id=guild_id).first()
+            if election is None:
+                return  # finished meanwhile
+            candidates_votes = election.candidates_votes
+            if str(user_id) in candidates_votes.keys():
+                return  # cannot vote for oneself
+            guild = self.bot.get_guild(guild_id)
+            try:
+                member = await internals.members.get_member(guild, user_id)
+            except discord.errors.NotFound:
+                return  # left the server
+            if member.bot:
+                return  # machines can't vote
+            if delta > 0:
+                server = await ServersSettings.filter(server_id=guild_id).first()
+                role_id, weight = self.heaviest_role(member, server)
+                if not weight:
+                    return  # none of the member's roles can vote
+                async with self.writing(election):
+                    weight = await self._cast(election, user_id, candidate, role_id, weight)
+            else:
+                async with self.writing(election):
+                    weight = -await self._retract(election, user_id, candidate)
+            if weight:
+                self.tally_changed(election, [candidate])
+        votes_logger.info(
+            "Reaction vote applied",
+            extra=log.fields(election_id=election.id, voter_id=user_id, emoji_id=emoji_id, delta=weight),
+        )
+
+    @staticmethod
+    def heaviest_role(member, server):
+        """
+        Get the member's role with the largest voting weight, which decides how many votes they cast.
+        Args: member, server settings
+        Return value: (role id, weight), (None, 0) if none of the member's roles has a weight
+        """
+        role_weights = server.role_weights or {}
+        weights = [(role_weights[str(i.id)], i.id) for i in member.roles if str(i.id) in role_weights]
+        weight, role_id = max(weights, default=(0, None))
+        return role_id, weight
+
+    async def voters(self, election_id):
+        """
+        Get how many ballots every voter of an election has cast, so that turnout changes are found without
+        looking through the ballots. Loaded with one query on the election's first vote, then kept up to date.
+        Must be called under the guild's lock.
+        Args: election id
+        Return value: {voter_id: ballots}
+        """
+        voters = self.voter_ballots.get(election_id)
+        if voters is None:
+            rows = await (
+                ElectionBallots.filter(election_id=election_id)
+                .group_by("voter_id")
+                .annotate(ballots=Count("id"))
+                .values_list("voter_id", "ballots")
+            )
+            voters = self.voter_ballots[election_id] = dict(rows)
+        return voters
+
+    @contextlib.asynccontextmanager
+    async def writing(self, election):
+        """
+        Write a vote's ballot and the election's tally in one transaction.
+        If it fails, the election's cached voters are dropped, they may count a ballot that was never written.
+        Args: election
+        Return value: async context manager
+        """
+        try:
+            async with in_transaction():
+                yield
+                await election.save(update_fields=["candidates_votes"])
+        except BaseException:
+            self.voter_ballots.pop(election.id, None)
+            raise
+
+    async def _cast(self, election, voter_id, candidate, role_id, weight):
+        """
+        Add a vote to the tally and the ballots, and count it in the rollups. A vote already cast is not added again.
+        Args: election, voter id, candidate key of candidates_votes, voter's heaviest role id, its weight
+        Return value: weight added to the tally, 0 if the vote was already cast
+        """
+        voters = await self.voters(election.id)
+        key = {"election_id": election.id, "voter_id": voter_id, "candidate_id": int(candidate)}
+        if await ElectionBallots.filter(**key).exists():
+            return 0
+        await ElectionBallots.create(**key, weight=weight, role_id=role_id)
+        if not voters.get(voter_id):
+            analytics.rollups.record(election.server_id, election.id, "voters", 0, 1)
+        voters[voter_id] = voters.get(voter_id, 0) + 1
+        election.candidates_votes[candidate][1] += weight
+        analytics.rollups.record(election.server_id, election.id, "candidate", int(candidate), weight)
+        analytics.rollups.record(election.server_id, election.id, "role", role_id, weight)
+        return weight
+
+    async def _retract(self, election, voter_id, candidate):
+        """
+        Take a vote back out of the tally, the ballots and the rollups, with the weight and role it was cast with.
+        Nothing changes if the voter has no ballot for the candidate: their reaction counted for nothing,
+        or the throttle applies a retraction before the vote it takes back.
+        Args: election, voter id, candidate key of candidates_votes
+        Return value: weight taken off the tally, 0 if there was no vote
+        """
+        voters = await self.voters(election.id)
+        ballot = await ElectionBallots.filter(
+            election_id=election.id, voter_id=voter_id, candidate_id=int(candidate)
+        ).first()
+        if ballot is None:
+            return 0
+        await ballot.delete()
+        voters[voter_id] = voters.get(voter_id, 1) - 1
+        if not voters[voter_id]:
+            del voters[voter_id]
+            analytics.rollups.record(election.server_id, election.id, "voters", 0, -1)
+        election.candidates_votes[candidate][1] -= ballot.weight
+        analytics.rollups.record(election.server_id, election.id, "candidate", int(candidate), -ballot.weight)
+        analytics.rollups.record(election.server_id, election.id, "role", ballot.role_id, -ballot.weight)
+        return ballot.weight
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction):
+        """
+        Listener that counts button board clicks as votes. A click toggles the voter's vote for that candidate.
+        The voter gets an ephemeral acknowledgement right away; the board itself is redrawn at most every BOARD_REFRESH seconds.
+        Args: none except interaction (a Discord structure)
+        Return value: None
+        """
+        if interaction.type != discord.InteractionType.component or interaction.guild_id is None:
+            return
+        custom_id = interaction.data.get("custom_id", "")
+        if not custom_id.startswith(VOTE_BUTTON_PREFIX):
+            return
+        metrics.increment("buttons.received")
+        election_id, candidate_id = custom_id[len(VOTE_BUTTON_PREFIX):].split(":")
+        if not self.throttle.allow(interaction.guild_id, interaction.user.id):
+            metrics.increment("buttons.throttled")
+            await interaction.response.send_message("You are voting too fast, try again in a few seconds.", ephemeral=True)
+            return
+        vote = asyncio.create_task(
+            self._toggle_vote(interaction, int(election_id), candidate_id), name="listener:button-vote"
+        )
+        try:
+            # Discord wants an answer within 3 seconds; shielded so a slow write still finishes
+            outcome = await asyncio.wait_for(asyncio.shield(vote), VOTE_ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            outcome = "Your vote is being counted."
+        except Exception:
+            metrics.increment("buttons.failed")
+            votes_logger.exception("Failed to apply a vote", extra=log.fields(custom_id=custom_id))
+            outcome = "Something went wrong, your vote was not counted."
+        await interaction.response.send_message(outcome, ephemeral=True)
+
+    async def _toggle_vote(self, interaction, election_id, candidate_id):
+        """
+        Cast or retract a member's vote for a candidate on a button board.
+        Args: interaction, election id, candidate id of type str
+        Return value: message for the voter of type str
+        """
+        voter = interaction.user
+        async with self.guild_locks[interaction.guild_id]:
+            election = await Elections.filter(id=election_id, server_id=interaction.guild_id).first()
+            if election is None or candidate_id not in election.candidates_votes:
+                return "This election is over."
+            if str(voter.id) in election.candidates_votes:
+                return "Candidates cannot vote in their own election."
+            name = await self.candidate_name(interaction.guild, int(candidate_id))
+            voted = await ElectionBallots.filter(
+                election_id=election.id, voter_id=voter.id, candidate_id=int(candidate_id)
+            ).exists()
+            if voted:
+                async with self.writing(election):
+                    await self._retract(election, voter.id, candidate_id)
+                outcome = f"Your vote for {name} was retracted."
+            else:
+                server = await ServersSettings.filter(server_id=interaction.guild_id).first()
+                role_id, weight = self.heaviest_role(voter, server)
+                if not weight:
+                    return "None of your roles can vote."
+                async with self.writing(election):
+                    await self._cast(election, voter.id, candidate_id, role_id, weight)
+                outcome = f"You voted for {name}."
+            self.tally_changed(election, [candidate_id])
+        metrics.increment("buttons.applied")
+        votes_logger.info(
+            "Button vote applied",
+            extra=log.fields(election_id=election.id, voter_id=voter.id, candidate_id=candidate_id, outcome=outcome),
+        )
+        self.schedule_board_refresh(election.id, interaction.message)
+        return outcome
+
+    def schedule_board_refresh(self, election_id, message):
+        """
+        Redraw a button board message's tallies BOARD_REFRESH seconds from now, unless a redraw is already due.
+        Args: election id, board message
+        Return value: None
+        """
+        if (election_id, message.id) not in self.board_refreshes:
+            self.board_refreshes[election_id, message.id] = asyncio.get_running_loop().call_later(
+                BOARD_REFRESH,
+                lambda: asyncio.create_task(self._refresh_board(election_id, message), name="board-refresh"),
+            )
+
+    async def _refresh_board(self, election_id, message):
+        """
+        Redraw a button board with the current tallies.
+        """
+        self.board_refreshes.pop((election_id, message.id), None)  # votes from now on schedule the next redraw
+        election = await Elections.filter(id=election_id).first()
+        board = await self.board_entry(message.id)
+        if election is None or board is None:
+            return
+        try:
+            await message.edit(embed=await self.board_embed(message.guild, election, board[1]))
+        except discord.errors.HTTPException:
+            pass  # the board was deleted
+        metrics.increment("buttons.board_refreshes")
+
+
+async def setup(bot):
+    """
+    Extension entry point.
+    Args: bot object
+    Return value: None
+    """
+    await internals.setup_cog(bot, Voting, __name__)
@@ -1,14 +1,20 @@
 """
 Tortoise ORM models' definitions and db access internals.
 """
+import asyncio
 import os
 import warnings
 
 from dotenv import load_dotenv
 
 from tortoise import Tortoise, fields, run_async
+from tortoise.expressions import Q
 from tortoise.models import Model
 
+import src.db.migrations as migrations
+
+initialized = asyncio.Event()  # set once init() has connected and migrated
+
 class ServersSettings(Model):
     """
     Model for server-wide settings storage.
@@ -22,6 +28,7 @@ class ServersSettings(Model):
     election_managers = fields.TextField(default="")
     winner_selection_strategy = fields.TextField(default="max_votes")
     votes_cutoff = fields.IntField(default="0")
+    board_mode = fields.TextField(default="reactions")  # "reactions" or "buttons"
 
     def __str__(self):
         """
@@ -43,7 +50,8 @@ class Elections(Model):
     server_id = fields.IntField()
     timestamp = fields.DatetimeField()
     candidates_votes = fields.JSONField()  # dict: {"name": [emoji_id, number_of_votes]}
-    progress_message = fields.IntField(default=-1)
+    progress_message = fields.BigIntField(null=True, unique=True)  # first voting board message id, unset until it is posted, see ElectionBoards
+    channel_id = fields.BigIntField(null=True)  # channel of the voting board, unknown for elections started before it was recorded
 
     def __str__(self):
         """
@@ -54,6 +62,140 @@ class Elections(Model):
     class Meta:
         table = "elections"
         table_description = "Stores individual election instances"
+        # the (server_id, timestamp) index is built by migration 1, see migrations.py
+
+
+class ElectionBoards(Model):
+    """
+    Model for the messages making up an election's voting board.
+    A board has a message per MAX_REACTIONS (reactions) or MAX_BUTTONS (buttons) candidates; on reaction boards
+    the same emojis are reused in every message, so a vote is identified by (message_id, emoji_id).
+    """
+
+    id = fields.IntField(pk=True)
+    election_id = fields.IntField(index=True)
+    message_id = fields.BigIntField(unique=True)
+    position = fields.IntField()  # order of the message on the board, 0 is the pinned one (Elections.progress_message)
+    candidates = fields.JSONField()  # dict: {candidate_id: emoji_id}, emoji_id is null on button boards
+
+    def __str__(self):
+        """
+        Magic.
+        """
+        return f"{self.election_id}:{self.position}"
+
+    class Meta:
+        table = "election_boards"
+        table_description = "Stores the messages of election voting boards"
+
+
+class ElectionBallots(Model):
+    """
+    Model for the votes cast in an election, one row per (voter, candidate), so that a retraction takes back
+    exactly the weight that was cast. Votes cast before ballots were kept have no row.
+    """
+
+    id = fields.IntField(pk=True)
+    election_id = fields.IntField()
+    voter_id = fields.BigIntField()
+    candidate_id = fields.BigIntField()
+    weight = fields.IntField()
+    role_id = fields.BigIntField()  # the voter's heaviest role when voting
+
+    def __str__(self):
+        """
+        Magic.
+        """
+        return f"{self.election_id}:{self.voter_id}:{self.candidate_id}"
+
+    class Meta:
+        table = "election_ballots"
+        table_description = "Stores the votes cast in elections"
+        unique_together = (("election_id", "voter_id", "candidate_id"),)  # also backs the per-election lookups
+
+
+class ElectionRollups(Model):
+    """
+    Model for per-minute election analytics, see analytics.py.
+    Kept after an election finishes.
+    """
+
+    id = fields.IntField(pk=True)
+    server_id = fields.BigIntField()
+    election_id = fields.IntField()
+    minute = fields.IntField()  # minutes since the epoch
+    dimension = fields.TextField()  # "candidate", "role" or "voters"
+    subject_id = fields.BigIntField()  # candidate or role id, 0 for "voters"
+    delta = fields.IntField()  # net change during the minute: weighted votes, or distinct voters
+    events = fields.IntField()  # vote changes during the minute
+
+    def __str__(self):
+        """
+        Magic.
+        """
+        return f"{self.election_id}:{self.minute}:{self.dimension}:{self.subject_id}"
+
+    class Meta:
+        table = "election_rollups"
+        table_description = "Stores per-minute election analytics"
+        unique_together = (("election_id", "minute", "dimension", "subject_id"),)  # the upsert target
+
+
+class SchemaMigrations(Model):
+    """
+    Model recording which migrations (see migrations.py) have been applied.
+    """
+
+    version = fields.IntField(pk=True)
+    description = fields.TextField()
+    applied_at = fields.DatetimeField()
+
+    def __str__(self):
+        """
+        Magic.
+        """
+        return str(self.version)
+
+    class Meta:
+        table = "schema_migrations"
+        table_description = "Stores applied schema migrations"
+
+
+async def elections_page(server_id, after=None, before=None, limit=10):
+    """
+    Fetch one page of a server's elections ordered by (timestamp, id) using keyset pagination,
+    so every page costs one LIMIT query no matter how many elections the server has.
+    Args: server id, (timestamp, id) cursor to page forward from or backward from, page size
+    Return value: (list of Elections, whether there are more elections in the paging direction)
+    """
+    query = Elections.filter(server_id=server_id)
+    if after is not None:
+        query = query.filter(
+            Q(timestamp__gt=after[0]) | Q(timestamp=after[0], id__gt=after[1])
+        ).order_by("timestamp", "id")
+    elif before is not None:
+        query = query.filter(
+            Q(timestamp__lt=before[0]) | Q(timestamp=before[0], id__lt=before[1])
+        ).order_by("-timestamp", "-id")
+    else:
+        query = query.order_by("timestamp", "id")
+    elections = list(await query.limit(limit + 1))
+    has_more = len(elections) > limit
+    elections = elections[:limit]
+    if before is not None:
+        elections.reverse()
+    return elections, has_more
+
+
+async def election_ballots(election_id):
+    """
+    Fetch all ballots of an election as plain tuples, for batch recounts (see tally.py).
+    Args: election id
+    Return value: list of (voter_id, candidate_id, weight, role_id)
+    """
+    return await ElectionBallots.filter(election_id=election_id).values_list(
+        "voter_id", "candidate_id", "weight", "role_id"
+    )
 
 
 async def init():
@@ -76,7 +218,13 @@ async def init():
         db_url=database_path,
         modules={"models": [f"{__name__}"]},
         )
+    connection = Tortoise.get_connection("default")
+    fresh = not await migrations.table_exists(connection, Elections._meta.db_table)
     await Tortoise.generate_schemas(safe=True)
+    await migrations.migrate(connection, fresh=fresh)
+    for problem in await migrations.check_drift(connection):
+        warnings.warn(f"Database schema does not match the models: {problem}")
+    initialized.set()
 
 
 async def db_cleanup():
@@ -0,0 +1,346 @@
+"""
+Versioned schema migrations and model/schema drift detection.
+
+`generate_schemas(safe=True)` only creates missing tables, it never alters an existing one.
+Everything that changes an existing table goes here as a numbered migration instead.
+Each migration is a list of steps per SQL dialect; a step is either an SQL statement or
+a coroutine function taking the connection (for batched backfills). Steps run in autocommit
+mode one after another, so no step holds locks for longer than it has to:
+indexes are built CONCURRENTLY on Postgres and backfills touch BACKFILL_BATCH rows at a time.
+Plain indexes on existing tables are therefore declared here rather than in the models' Meta.indexes:
+generate_schemas would build those with a blocking CREATE INDEX before any migration runs.
+"""
+import datetime
+import json
+import re
+import typing as tp
+
+from tortoise import Tortoise
+
+import src.log as log
+
+BACKFILL_BATCH = 1000
+logger = log.get_logger("db")
+
+
+class Migration:
+    """
+    A single schema change.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        description: str,
+        steps: tp.Dict[str, list],
+        indexes: tp.Optional[tp.Dict[str, tp.List[tp.Tuple[str, ...]]]] = None,
+    ):
+        """
+        Args: version number, human-readable description, {dialect: list of SQL strings or coroutine functions},
+        {table: [columns]} of the plain indexes it builds, which the models don't declare;
+        such a migration is applied to a fresh schema too, so it should build nothing but those
+        Return value: None
+        """
+        self.version = version
+        self.description = description
+        self.steps = steps
+        self.indexes = indexes or {}
+
+    async def apply(self, connection) -> None:
+        """
+        Run the migration's steps for the connection's dialect.
+        Args: Tortoise connection
+        Return value: None
+        """
+        dialect = connection.capabilities.dialect
+        if dialect not in self.steps:
+            raise RuntimeError(
+                f"Migration {self.version} ({self.description}) has no {dialect} version, recreate the database."
+            )
+        for step in self.steps[dialect]:
+            if isinstance(step, str):
+                await connection.execute_script(step)
+            else:
+                await step(connection)
+
+
+async def _null_unset_progress_messages(connection) -> None:
+    """
+    Backfill: elections without a voting board used -1 as progress_message, make that NULL
+    so that the column can be unique. Runs in small batches to avoid long row locks.
+    """
+    while True:
+        rows = await connection.execute_query_dict(
+            'UPDATE "elections" SET "progress_message" = NULL WHERE "id" IN ('
+            f'SELECT "id" FROM "elections" WHERE "progress_message" = -1 LIMIT {BACKFILL_BATCH}'
+            ') RETURNING "id"'
+        )
+        if not rows:
+            return
+
+
+async def _rebuild_sqlite_elections(connection) -> None:
+    """
+    SQLite can't alter a column, so elections is copied into a new table whose progress_message is a nullable
+    BIGINT without a default, keeping every other column and the indexes as they are. Runs in one transaction.
+    """
+    rows = await connection.execute_query_dict(
+        "SELECT type, sql FROM sqlite_master WHERE tbl_name = 'elections' AND sql IS NOT NULL"
+    )
+    table = next(i["sql"] for i in rows if i["type"] == "table")
+    indexes = [i["sql"] for i in rows if i["type"] == "index"]
+    create, count = re.subn(
+        r'"progress_message" \w+( NOT NULL)?( +DEFAULT \S+?)?(?=\s*[,)/])', '"progress_message" BIGINT', table
+    )
+    if count != 1:
+        raise RuntimeError("Unexpected definition of elections.progress_message, recreate the database.")
+    create = create.replace('"elections"', '"elections_rebuilt"', 1)
+    await connection.execute_script(
+        "BEGIN;\n"
+        f"{create};\n"
+        'INSERT INTO "elections_rebuilt" SELECT * FROM "elections";\n'
+        'DROP TABLE "elections";\n'
+        'ALTER TABLE "elections_rebuilt" RENAME TO "elections";\n'
+        + "".join(f"{i};\n" for i in indexes)
+        + "COMMIT;"
+    )
+
+
+async def _backfill_election_boards(connection) -> None:
+    """
+    Backfill: every election with a voting board gets its (single) board message recorded in election_boards,
+    in batches of BACKFILL_BATCH elections.
+    """
+    placeholders = "$1, $2, $3, $4" if connection.capabilities.dialect == "postgres" else "?, ?, ?, ?"
+    insert = (
+        f'INSERT INTO "election_boards" ("election_id", "message_id", "position", "candidates") VALUES ({placeholders})'
+    )
+    last = 0
+    while True:
+        rows = await connection.execute_query_dict(
+            'SELECT "id", "progress_message", "candidates_votes" FROM "elections" '
+            f'WHERE "id" > {last} AND "progress_message" IS NOT NULL AND "id" NOT IN '
+            '(SELECT "election_id" FROM "election_boards") '
+            f'ORDER BY "id" LIMIT {BACKFILL_BATCH}'
+        )
+        if not rows:
+            return
+        boards = []
+        for row in rows:
+            candidates_votes = row["candidates_votes"]
+            if isinstance(candidates_votes, str):
+                candidates_votes = json.loads(candidates_votes)
+            candidates = {candidate: emoji for candidate, (emoji, _) in candidates_votes.items()}
+            boards.append((row["id"], row["progress_message"], 0, json.dumps(candidates)))
+        await connection.execute_many(insert, boards)
+        last = rows[-1]["id"]
+
+
+MIGRATIONS = (
+    Migration(
+        1,
+        "Index elections by (server_id, timestamp)",
+        {
+            "postgres": [
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_elections_server_timestamp" '
+                'ON "elections" ("server_id", "timestamp")',
+            ],
+            "sqlite": [
+                'CREATE INDEX IF NOT EXISTS "idx_elections_server_timestamp" '
+                'ON "elections" ("server_id", "timestamp")',
+            ],
+        },
+        indexes={"elections": [("server_id", "timestamp")]},  # backs the keyset pagination in db.elections_page
+    ),
+    Migration(
+        2,
+        "Make elections.progress_message nullable and unique",
+        {
+            "postgres": [
+                'ALTER TABLE "elections" ALTER COLUMN "progress_message" DROP NOT NULL',
+                'ALTER TABLE "elections" ALTER COLUMN "progress_message" DROP DEFAULT',
+                'ALTER TABLE "elections" ALTER COLUMN "progress_message" TYPE BIGINT',  # message ids overflow INT
+                _null_unset_progress_messages,
+                'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "uid_elections_progress_message" '
+                'ON "elections" ("progress_message")',
+            ],
+            "sqlite": [
+                _rebuild_sqlite_elections,
+                _null_unset_progress_messages,
+                'CREATE UNIQUE INDEX IF NOT EXISTS "uid_elections_progress_message" '
+                'ON "elections" ("progress_message")',
+            ],
+        },
+    ),
+    Migration(
+        3,
+        "Move the elections id sequence past ids assigned by hand",
+        {
+            "postgres": [
+                "SELECT setval(pg_get_serial_sequence('elections', 'id'), "
+                'COALESCE((SELECT MAX("id") FROM "elections"), 0) + 1, false)',
+            ],
+            "sqlite": [],  # AUTOINCREMENT already continues from the largest id
+        },
+    ),
+    Migration(
+        4,
+        "Add servers_settings.board_mode",
+        {
+            "postgres": [
+                'ALTER TABLE "servers_settings" ADD COLUMN IF NOT EXISTS "board_mode" '
+                "TEXT NOT NULL DEFAULT 'reactions'",
+            ],
+            "sqlite": [
+                'ALTER TABLE "servers_settings" ADD COLUMN "board_mode" '
+                "TEXT NOT NULL DEFAULT 'reactions'",
+            ],
+        },
+    ),
+    Migration(
+        5,
+        "Add elections.channel_id",
+        {
+            "postgres": ['ALTER TABLE "elections" ADD COLUMN IF NOT EXISTS "channel_id" BIGINT'],
+            "sqlite": ['ALTER TABLE "elections" ADD COLUMN "channel_id" BIGINT'],
+        },
+    ),
+    Migration(
+        6,
+        "Record existing voting boards in election_boards",
+        {
+            "postgres": [_backfill_election_boards],
+            "sqlite": [_backfill_election_boards],
+        },
+    ),
+)
+
+
+async def table_exists(connection, table: str) -> bool:
+    """
+    Check whether a table exists.
+    Args: Tortoise connection, table name
+    Return value: bool
+    """
+    if connection.capabilities.dialect == "sqlite":
+        rows = await connection.execute_query_dict(
+            f"SELECT name FROM sqlite_master WHERE type = 'table' AND name = '{table}'"
+        )
+    else:
+        rows = await connection.execute_query_dict(f"SELECT to_regclass('{table}') AS name")
+        rows = [i for i in rows if i["name"]]
+    return bool(rows)
+
+
+async def migrate(connection, fresh: bool) -> None:
+    """
+    Apply pending migrations in order and record them.
+    A freshly created schema already matches the models, so it is only stamped as up to date,
+    except for the indexes that only migrations build.
+    Args: Tortoise connection, whether generate_schemas has just created the tables
+    Return value: None
+    """
+    from src.db.db import SchemaMigrations  # the models module imports this one
+
+    applied = set(await SchemaMigrations.all().values_list("version", flat=True))
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        if not fresh or migration.indexes:
+            logger.info(
+                "Applying migration", extra=log.fields(version=migration.version, description=migration.description)
+            )
+            await migration.apply(connection)
+        await SchemaMigrations.create(
+            version=migration.version,
+            description=migration.description,
+            applied_at=datetime.datetime.now(),
+        )
+
+
+async def _columns(connection, table: str) -> tp.Dict[str, bool]:
+    """
+    Get the columns of a table.
+    Return value: {column name: nullable}
+    """
+    if connection.capabilities.dialect == "sqlite":
+        rows = await connection.execute_query_dict(f'PRAGMA table_info("{table}")')
+        return {i["name"]: not i["notnull"] and not i["pk"] for i in rows}
+    rows = await connection.execute_query_dict(
+        "SELECT column_name, is_nullable FROM information_schema.columns "
+        f"WHERE table_schema = current_schema() AND table_name = '{table}'"
+    )
+    return {i["column_name"]: i["is_nullable"] == "YES" for i in rows}
+
+
+async def _indexes(connection, table: str) -> tp.Set[tp.Tuple[tp.Tuple[str, ...], bool]]:
+    """
+    Get the indexes (including the ones backing constraints) of a table.
+    Return value: set of (column names, unique)
+    """
+    if connection.capabilities.dialect == "sqlite":
+        indexes = set()
+        for index in await connection.execute_query_dict(f'PRAGMA index_list("{table}")'):
+            columns = await connection.execute_query_dict(f'PRAGMA index_info("{index["name"]}")')
+            columns = tuple(i["name"] for i in sorted(columns, key=lambda i: i["seqno"]))
+            indexes.add((columns, bool(index["unique"])))
+        return indexes
+    rows = await connection.execute_query_dict(
+        "SELECT array_agg(a.attname ORDER BY k.ord) AS columns, i.indisunique AS is_unique "
+        "FROM pg_index i JOIN pg_class t ON t.oid = i.indrelid "
+        "CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord) "
+        "JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum "
+        f"WHERE t.relname = '{table}' AND t.relnamespace = current_schema()::regnamespace "
+        "GROUP BY i.indexrelid, i.indisunique"
+    )
+    return {(tuple(i["columns"]), i["is_unique"]) for i in rows}
+
+
+async def check_drift(connection) -> tp.List[str]:
+    """
+    Compare every model with the table it maps to.
+    Args: Tortoise connection
+    Return value: list of human-readable differences, empty if the schema matches the models
+    """
+    problems = []
+    for model in Tortoise.apps["models"].values():
+        meta = model._meta
+        table = meta.db_table
+        columns = await _columns(connection, table)
+        if not columns:
+            problems.append(f"table {table} is missing")
+            continue
+        expected = {}  # dict: {column: nullable}
+        wanted_indexes = set()
+        for name, column in meta.fields_db_projection.items():
+            field = meta.fields_map[name]
+            expected[column] = field.null and not field.pk
+            if field.pk:
+                continue  # the primary key is indexed by definition
+            if field.unique:
+                wanted_indexes.add(((column,), True))
+            elif field.index:
+                wanted_indexes.add(((column,), False))
+        for index in meta.indexes:
+            wanted_indexes.add((tuple(meta.fields_db_projection[i] for i in index), False))
+        for migration in MIGRATIONS:
+            for index in migration.indexes.get(table, []):
+                wanted_indexes.add((tuple(index), False))
+        for together in meta.unique_together:
+            wanted_indexes.add((tuple(meta.fields_db_projection[i] for i in together), True))
+
+        for column, nullable in expected.items():
+            if column not in columns:
+                problems.append(f"{table}.{column} is missing")
+            elif columns[column] != nullable:
+                problems.append(f"{table}.{column} should {'' if nullable else 'not '}be nullable")
+        for column in columns.keys() - expected.keys():
+            problems.append(f"{table}.{column} is not in the model")
+        indexes = await _indexes(connection, table)
+        for columns_, unique in wanted_indexes:
+            # a unique index also serves plain lookups
+            if (columns_, unique) not in indexes and (unique or (columns_, True) not in indexes):
+                problems.append(
+                    f"{table} has no {'unique ' if unique else ''}index on ({', '.join(columns_)})"
+                )
+    return problems
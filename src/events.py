@@ -1,15 +1,16 @@
 """
 Bot event responses.
 """
-import datetime
-
 import discord
 from discord.ext import commands
 
 import src.db.db as db
 import src.internals as internals
+import src.log as log
 from src.db.db import ServersSettings
 
+logger = log.get_logger("events")
+
 @internals.bot.event
 async def on_ready():
     """
@@ -17,20 +18,15 @@ async def on_ready():
     Args: None
     Return value: None
     """
-    print("Starting up...")
+    logger.info("Starting up")
     await internals.bot.change_presence(
         activity=discord.Activity(type=discord.ActivityType.playing, name="election fraud")  # ha!
     )
-    print("Initializing database connection...")
+    logger.info("Initializing database connection")
     await db.init()
-    print("Initialized!")
-    start_timestamp = datetime.datetime.now()
-    print(f"Bot ready at: {start_timestamp}")
+    logger.info("Bot ready", extra=log.fields(user=str(internals.bot.user), guilds=len(internals.bot.guilds)))
     for guild in internals.bot.guilds:
-        guild_timestamp = datetime.datetime.now()
-        print(
-            f"{internals.bot.user} is connected to {guild.name} (id: {guild.id}) at {guild_timestamp}"
-        )
+        logger.debug("Connected to server", extra=log.fields(guild_id=guild.id, guild=guild.name))
 
 @internals.bot.event
 async def on_disconnect():
@@ -39,7 +35,7 @@ async def on_disconnect():
     Args: None
     Return value: None
     """
-    print("Disconnected from Discord, cleaning up DB connection...")
+    logger.warning("Disconnected from Discord, cleaning up DB connection")
     await db.db_cleanup()
 
 @internals.bot.event
@@ -49,26 +45,26 @@ async def on_guild_join(guild):
     Args: server object
     Return value: None
     """
-    guild_timestamp = datetime.datetime.now()
     server = await ServersSettings.create(server_id=guild.id)
     server.prefixes = internals.DEFAULT_PREFIX
     managers = [str(i.id) for i in guild.roles if i.permissions.manage_guild]
     server.election_managers = ",".join(managers)
     await server.save()
+    internals.reads.invalidate(guild.id)
     await guild.get_member(internals.bot.user.id).edit(nick=f"[{internals.DEFAULT_PREFIX}]{internals.bot.user.name}")
-    print(f"Joined server {guild.name} (id: {guild.id}) at ({guild_timestamp})")
+    logger.info("Joined server", extra=log.fields(guild_id=guild.id, guild=guild.name))
 
 @internals.bot.event
 async def on_guild_remove(guild):
     """
-    Activated on server leave. Cleans up server settings.
+    Activated on server leave. Cleans up server settings; the server's elections are
+    purged by the maintenance cog's next run.
     Args: server object
     Return value: None
     """
-    guild_timestamp = datetime.datetime.now()
-    server = await ServersSettings.filter(server_id=guild.id).first()
-    await server.delete()
-    print(f"Left server {guild.name} (id: {guild.id}) at ({guild_timestamp})")
+    await ServersSettings.filter(server_id=guild.id).delete()  # the row may already be gone
+    internals.reads.invalidate(guild.id)
+    logger.info("Left server", extra=log.fields(guild_id=guild.id, guild=guild.name))
 
 @internals.bot.event
 async def on_command_error(ctx, error):
@@ -7,8 +7,6 @@ from discord.ext import commands
 
 import src.internals as internals
 
-from src.db.db import ServersSettings
-
 
 async def get_id_by_mention(mention: str) -> int:
     """
@@ -49,7 +47,7 @@ async def get_user_mention_by_id(identifier: str) -> str:
     Return value: mention of type str
     """
     # user mentions only for now
-    user = internals.bot.get_user(
+    user = await internals.members.get_user(
         int(identifier)
     )  # explicit cast required to avoid illegal argument exceptions
     if not await get_mention_type(user.mention) == "user":
@@ -97,7 +95,7 @@ async def get_emoji_id_from_embed_field(field: str) -> int:
     return emoji_id
 
 async def is_election_manager(ctx) -> bool:
-    server = await ServersSettings(server_id=ctx.guild.id).first()
+    server = await internals.server_settings(ctx.guild.id)
     managers = set([int(i) for i in server.election_managers.split(",")])
     author_roles = set([i.id for i in ctx.author.roles])
     if not author_roles.intersection(managers):
@@ -1,41 +1,146 @@
 """
 Internal definitions and global vars.
 """
+import asyncio
 import os
+import time
 import typing as tp
 
 import discord
+import yarl
 from discord.ext import commands
 from dotenv import load_dotenv
 
-import src.db.db as db
-
-import src.cogs.servers_settings as servers_settings
-import src.cogs.technical as technical
-import src.cogs.voting as voting
-import src.cogs.god as god
+import src.log as log
+import src.member_cache as member_cache
+import src.singleflight as singleflight
+import src.watchdog as watchdog
+from src.db.db import ServersSettings
 
 load_dotenv()  # export the vars from .env as environ vars
 TOKEN = os.getenv("BOT_TOKEN")  # because, you know, it's supposed to be *secret*
 IN_MEMORY_DB = os.getenv("IN_MEMORY_DB")  # whether we store the database in memory or in a file
 DEFAULT_PREFIX = "!"
+LEAN_MEMBER_CACHE = bool(int(os.getenv("LEAN_MEMBER_CACHE", "0")))  # don't chunk or cache members, see member_cache
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", member_cache.DEFAULT_SIZE))
+API_BASE = os.getenv("DISCORD_API_BASE")  # point the bot at a local stand-in instead, see loadtest/
+GATEWAY_URL = os.getenv("DISCORD_GATEWAY_URL")
+if API_BASE:
+    discord.http.Route.BASE = API_BASE
+if GATEWAY_URL:
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(GATEWAY_URL)
+EXTENSIONS = (
+    "src.cogs.voting",
+    "src.cogs.technical",
+    "src.cogs.servers_settings",
+    "src.cogs.god",
+    "src.cogs.maintenance",
+    "src.cogs.stats",
+)
+extension_timings = {}  # dict: {extension_name: (import_seconds, setup_seconds)}
+_setup_timings = {}  # setup time reported by the extension itself, see setup_cog
+logger = log.get_logger("cogs")
+
+async def server_settings(guild_id: int) -> tp.Optional[ServersSettings]:
+    """
+    Get a server's settings for reading, shared between concurrent readers and cached for a few seconds.
+    Do not modify the returned object; commands changing settings fetch their own and call reads.invalidate.
+    Args: server id
+    Return value: ServersSettings, None if the server has none
+    """
+    return await reads.do(guild_id, "settings", lambda: ServersSettings.filter(server_id=guild_id).first())
 
 async def get_prefix(bot: commands.bot, message: tp.Any) -> tp.Any:
     """
     Get the bot prefix.
     """
-    server = await servers_settings.ServersSettings().filter(server_id=message.guild.id).first()
+    server = await server_settings(message.guild.id)
     prefixes_str = server.prefixes
     prefixes = prefixes_str.split(",")
 
     return commands.bot.when_mentioned_or(*prefixes)(bot, message)
 
+async def setup_cog(bot: commands.Bot, cog_class: tp.Type[commands.Cog], extension: str) -> None:
+    """
+    Add a cog to the bot and remember how long it took.
+    Meant to be called from an extension's `setup` entry point.
+    Args: bot object, cog class, extension name (the module's __name__)
+    Return value: None
+    """
+    start = time.perf_counter()
+    await bot.add_cog(cog_class(bot))
+    _setup_timings[extension] = time.perf_counter() - start
+
+async def _timed(action: tp.Callable[[str], tp.Awaitable[None]], extension: str) -> tp.Tuple[float, float]:
+    """
+    Run load_extension/reload_extension and split the time spent into import and setup.
+    Args: bound load/reload method, extension name
+    Return value: (import_seconds, setup_seconds)
+    """
+    _setup_timings.pop(extension, None)
+    start = time.perf_counter()
+    await action(extension)
+    total = time.perf_counter() - start
+    setup = _setup_timings.pop(extension, 0.0)
+    extension_timings[extension] = (total - setup, setup)
+    return extension_timings[extension]
+
+async def load_extensions() -> None:
+    """
+    Load all cogs as extensions, recording import and setup time of each.
+    Args: None
+    Return value: None
+    """
+    for extension in EXTENSIONS:
+        import_time, setup_time = await _timed(bot.load_extension, extension)
+        logger.info(
+            "Loaded extension",
+            extra=log.fields(extension=extension, import_ms=round(import_time * 1000, 1), setup_ms=round(setup_time * 1000, 1)),
+        )
+
+async def reload_extension(extension: str) -> tp.Tuple[float, float]:
+    """
+    Reload a single extension in place, keeping the gateway session alive.
+    Args: extension name
+    Return value: (import_seconds, setup_seconds)
+    """
+    return await _timed(bot.reload_extension, extension)
+
+class ElectionsBot(commands.Bot):
+    """
+    The bot, loading its cogs before connecting to the gateway.
+    """
+
+    async def setup_hook(self) -> None:
+        """
+        Called once on login, before the gateway connection.
+        """
+        watchdog.monitor.start()
+        await load_extensions()
+
 bot_intents = discord.Intents.default()
 bot_intents.members = True
 bot_intents.reactions = True
-bot = commands.Bot(command_prefix=get_prefix, intents=bot_intents)
+bot_intents.message_content = True  # prefix commands need to read messages
+if LEAN_MEMBER_CACHE:
+    bot = ElectionsBot(
+        command_prefix=get_prefix,
+        intents=bot_intents,
+        chunk_guilds_at_startup=False,
+        member_cache_flags=discord.MemberCacheFlags.none(),
+    )
+else:
+    bot = ElectionsBot(command_prefix=get_prefix, intents=bot_intents)
 del bot_intents
-bot.add_cog(voting.Voting(bot))
-bot.add_cog(technical.Technical(bot))
-bot.add_cog(servers_settings.Settings(bot))
-bot.add_cog(god.God(bot))
\ No newline at end of file
+members = member_cache.MemberCache(bot, MEMBER_CACHE_SIZE)
+
+@bot.before_invoke
+async def label_command(ctx: commands.Context) -> None:
+    """
+    Name the task running a command after it, so that the loop watchdog can tell which command stalled the loop.
+    Args: context
+    Return value: None
+    """
+    asyncio.current_task().set_name(f"command:{ctx.command.qualified_name}")
+
+reads = singleflight.SingleFlight()  # coalesced reads of server settings and read-only commands, keyed per guild
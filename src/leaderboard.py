@@ -0,0 +1,67 @@
+"""
+Ordered per-election leaderboards, kept up to date on every vote change instead of sorting the
+whole tally whenever the leaders are needed.
+"""
+import typing as tp
+
+from sortedcontainers import SortedList
+
+
+class Leaderboard:
+    """
+    Candidates of one election ordered by votes, most votes first.
+    Ties keep the order the candidates were listed in when the election started, like a stable sort would.
+    """
+
+    def __init__(self, candidates_votes: dict):
+        """
+        Args: the election's candidates_votes, {candidate_id: [emoji_id, votes]}
+        Return value: None
+        """
+        self.positions = {}  # dict: {candidate_id: position in the election's candidate list}
+        self.votes = {}  # dict: {candidate_id: votes}
+        entries = []
+        for position, (candidate, (_, votes)) in enumerate(candidates_votes.items()):
+            self.positions[candidate] = position
+            self.votes[candidate] = votes
+            entries.append((-votes, position, candidate))
+        self.entries = SortedList(entries)  # of (-votes, position, candidate_id)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def update(self, candidate: str, votes: int) -> None:
+        """
+        Move a candidate to its place for a new vote count, in O(log n).
+        Args: candidate id, the candidate's votes now
+        Return value: None
+        """
+        self.entries.remove((-self.votes[candidate], self.positions[candidate], candidate))
+        self.votes[candidate] = votes
+        self.entries.add((-votes, self.positions[candidate], candidate))
+
+    def top(self, count: int) -> tp.List[tp.Tuple[str, int]]:
+        """
+        Get the leading candidates.
+        Args: number of candidates
+        Return value: [(candidate_id, votes)], most votes first
+        """
+        return [(candidate, -votes) for votes, _, candidate in self.entries.islice(0, count)]
+
+    def at_least(self, cutoff: int) -> tp.List[tp.Tuple[str, int]]:
+        """
+        Get every candidate with at least `cutoff` votes.
+        Args: minimum votes
+        Return value: [(candidate_id, votes)], most votes first
+        """
+        return self.top(self.entries.bisect_right((-cutoff, len(self.entries))))
+
+    def winners(self, server) -> tp.List[tp.Tuple[str, int]]:
+        """
+        Get the candidates who would win if the election finished now.
+        Args: server settings, for winner_selection_strategy, winners_pool and votes_cutoff
+        Return value: [(candidate_id, votes)], most votes first
+        """
+        if server.winner_selection_strategy == "max_votes" and server.winners_pool:
+            return self.top(server.winners_pool)
+        return self.at_least(server.votes_cutoff)
@@ -0,0 +1,141 @@
+"""
+Logging setup: every subsystem logs through its own `elections.<subsystem>` logger, records go
+through a queue and are formatted as one JSON object per line and written to stdout by a
+background thread, so a log call on the event loop never waits for I/O.
+
+Configured with environment variables:
+LOG_LEVEL: level of every logger, INFO by default
+LOG_LEVELS: per-logger overrides, e.g. `elections.votes=DEBUG,discord.gateway=WARNING`
+LOG_SAMPLE_VOTES: only keep one in this many routine vote records, 100 by default
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import typing as tp
+
+SAMPLED_LOGGERS = {"elections.votes": "LOG_SAMPLE_VOTES"}  # dict: {logger name: env var with the sample rate}
+DEFAULT_SAMPLE_RATE = 100
+
+_listener = None
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    """
+    Get a subsystem's logger.
+    Args: subsystem name, e.g. "voting"
+    Return value: the `elections.<subsystem>` logger
+    """
+    return logging.getLogger(f"elections.{subsystem}")
+
+
+def fields(**kwargs) -> dict:
+    """
+    Attach structured fields to a record: `logger.info("message", extra=log.fields(key=value))`.
+    Args: fields as keyword arguments
+    Return value: dict to pass as `extra`
+    """
+    return {"fields": kwargs}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line of JSON.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if getattr(record, "sample_rate", None):
+            entry["sample_rate"] = record.sample_rate
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Lets through one in `rate` records below WARNING; warnings and errors always pass.
+    """
+
+    def __init__(self, rate: int):
+        """
+        Args: keep one in this many records
+        Return value: None
+        """
+        super().__init__()
+        self.rate = rate
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        self._seen += 1
+        if self._seen % self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the queue with their message rendered, keeping the traceback separate.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+def _levels() -> tp.Dict[str, int]:
+    """
+    Parse LOG_LEVELS.
+    Return value: {logger name: level}
+    """
+    levels = {}
+    for item in filter(None, os.getenv("LOG_LEVELS", "").split(",")):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def setup() -> None:
+    """
+    Route every logger (including discord.py's) through the queue and start the writer thread.
+    Args: None
+    Return value: None
+    """
+    global _listener
+    if _listener is not None:
+        return
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)  # drain the queue on exit
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(_QueueHandler(records))
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in _levels().items():
+        logging.getLogger(name).setLevel(level)
+    for name, variable in SAMPLED_LOGGERS.items():
+        logging.getLogger(name).addFilter(SampleFilter(int(os.getenv(variable, DEFAULT_SAMPLE_RATE))))
@@ -0,0 +1,82 @@
+"""
+Bounded member cache for the lean member-cache mode (LEAN_MEMBER_CACHE=1).
+In that mode discord.py keeps no members at all; the members the bot actually deals with
+(voters, candidates, winners) are fetched on first use and kept in an LRU keyed by (guild, user).
+In the default mode discord.py's own cache has everyone, so lookups never get past it.
+"""
+import collections
+import typing as tp
+
+import discord
+
+import src.metrics as metrics
+
+DEFAULT_SIZE = 10000  # members kept in lean mode
+
+
+class MemberCache:
+    """
+    LRU of members keyed by (guild_id, user_id), in front of discord.py's cache and the REST API.
+    """
+
+    def __init__(self, bot, maxsize: int = DEFAULT_SIZE):
+        """
+        Args: bot object, maximum number of cached members
+        Return value: None
+        """
+        self.bot = bot
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()  # dict: {(guild_id or None, user_id): Member or User}
+
+    def remember(self, member: tp.Union[discord.Member, discord.User]) -> None:
+        """
+        Cache a member that arrived with an event anyway (a reaction, an interaction, a mention).
+        Args: member, or user for lookups outside a guild
+        Return value: None
+        """
+        key = (member.guild.id if isinstance(member, discord.Member) else None, member.id)
+        self.entries[key] = member
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            metrics.increment("member_cache.evictions")
+
+    def _lookup(self, key: tp.Tuple[tp.Optional[int], int]) -> tp.Optional[tp.Union[discord.Member, discord.User]]:
+        """
+        Get a cached entry and mark it as recently used.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            metrics.increment("member_cache.misses")
+            return None
+        metrics.increment("member_cache.hits")
+        self.entries.move_to_end(key)
+        return entry
+
+    async def get_member(self, guild: discord.Guild, user_id: int) -> discord.Member:
+        """
+        Get a guild member from discord.py's cache, this cache or the API, in that order.
+        Args: guild, user id
+        Return value: member
+        Raises discord.errors.NotFound if the user is not in the guild.
+        """
+        member = guild.get_member(user_id) or self._lookup((guild.id, user_id))
+        if member is None:
+            metrics.increment("member_cache.fetches")
+            member = await guild.fetch_member(user_id)
+            self.remember(member)
+        return member
+
+    async def get_user(self, user_id: int) -> discord.User:
+        """
+        Get a user from discord.py's cache, this cache or the API, in that order.
+        Args: user id
+        Return value: user
+        Raises discord.errors.NotFound if there is no such user.
+        """
+        user = self.bot.get_user(user_id) or self._lookup((None, user_id))
+        if user is None:
+            metrics.increment("member_cache.fetches")
+            user = await self.bot.fetch_user(user_id)
+            self.remember(user)
+        return user
@@ -0,0 +1,33 @@
+"""
+In-process counters (and a few gauges) for things worth keeping an eye on.
+"""
+import collections
+
+counters = collections.Counter()  # dict: {metric_name: count}
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """
+    Increase a counter.
+    Args: metric name, amount to add
+    Return value: None
+    """
+    counters[name] += amount
+
+
+def gauge(name: str, value: float) -> None:
+    """
+    Set a metric that goes up and down (e.g. a lag), kept alongside the counters.
+    Args: metric name, current value
+    Return value: None
+    """
+    counters[name] = value
+
+
+def snapshot() -> dict:
+    """
+    Get the current value of every counter.
+    Args: None
+    Return value: dict {metric_name: count}
+    """
+    return dict(sorted(counters.items()))
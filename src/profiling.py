@@ -0,0 +1,174 @@
+"""
+On-demand CPU and memory profiling, driven by the owner commands in the God cog.
+Nothing here runs until a profile is started: the CPU profiler is a thread that only exists
+while sampling, and tracemalloc is only switched on between `start` and `stop`.
+Snapshots are taken and compared in a worker thread, so that the event loop keeps running meanwhile.
+"""
+import asyncio
+import collections
+import sys
+import threading
+import time
+import tracemalloc
+import typing as tp
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+MAX_PROFILE_DURATION = 300  # seconds; a forgotten CPU profile stops sampling by itself
+TRACEMALLOC_FRAMES = 10  # frames stored per allocation traceback
+
+
+def collapse(frame) -> str:
+    """
+    Turn a stack into one line of the collapsed-stack format flame graph tools read.
+    Args: innermost frame
+    Return value: "outer;...;inner" of type str, every entry being "module:function"
+    """
+    stack = []
+    while frame is not None:
+        stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread (the event loop's) from a background thread.
+    The sampled thread is never paused or instrumented, so the cost is one stack walk per sample.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, max_duration: float = MAX_PROFILE_DURATION):
+        """
+        Args: seconds between samples, seconds after which sampling stops by itself
+        Return value: None
+        """
+        self.interval = interval
+        self.max_duration = max_duration
+        self.samples = collections.Counter()  # dict: {collapsed stack: number of samples}
+        self.started = None
+        self.duration = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether a profile has been started and not stopped yet.
+        """
+        return self._thread is not None
+
+    def start(self) -> None:
+        """
+        Start sampling the calling thread.
+        Args: None
+        Return value: None
+        """
+        if self.running:
+            raise RuntimeError("A CPU profile is already running.")
+        self.samples.clear()
+        self._stop.clear()
+        self.started = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run, args=(threading.get_ident(),), name="cpu-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> str:
+        """
+        Stop sampling.
+        Args: None
+        Return value: the profile in the collapsed-stack format ("stack count" per line)
+        """
+        if not self.running:
+            raise RuntimeError("No CPU profile is running.")
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.monotonic() - self.started
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def _run(self, thread_id: int) -> None:
+        """
+        Sampling thread body.
+        """
+        deadline = time.monotonic() + self.max_duration
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                return  # the sampled thread is gone
+            self.samples[collapse(frame)] += 1
+            del frame  # don't keep the sampled thread's locals alive
+
+
+class MemoryProfiler:
+    """
+    tracemalloc snapshots, each one compared to the previous.
+    """
+
+    def __init__(self, frames: int = TRACEMALLOC_FRAMES):
+        """
+        Args: frames to record per allocation
+        Return value: None
+        """
+        self.frames = frames
+        self.snapshot = None
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether allocations are being traced.
+        """
+        return tracemalloc.is_tracing()
+
+    async def start(self) -> None:
+        """
+        Start tracing allocations and take the first snapshot.
+        Args: None
+        Return value: None
+        """
+        if self.running:
+            raise RuntimeError("Memory tracing is already on.")
+        tracemalloc.start(self.frames)
+        self.snapshot = await asyncio.to_thread(self._take)
+
+    async def diff(self, limit: int = 15) -> tp.List[str]:
+        """
+        Take a snapshot and compare it to the previous one; the new snapshot becomes the baseline.
+        Args: number of allocation sites to report
+        Return value: list of lines, the sites whose memory grew (or shrank) the most first
+        """
+        if not self.running:
+            raise RuntimeError("Memory tracing is off, start it first.")
+        snapshot = await asyncio.to_thread(self._take)
+        stats = await asyncio.to_thread(snapshot.compare_to, self.snapshot, "lineno")
+        self.snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced: {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB"]
+        lines.extend(str(i) for i in stats[:limit])
+        return lines
+
+    def stop(self) -> None:
+        """
+        Stop tracing and drop the snapshots.
+        Args: None
+        Return value: None
+        """
+        if not self.running:
+            raise RuntimeError("Memory tracing is already off.")
+        self.snapshot = None
+        tracemalloc.stop()
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        """
+        Take a snapshot without tracemalloc's own allocations.
+        """
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+
+
+cpu = SamplingProfiler()  # module-level so that a profile survives reloading the God cog
+memory = MemoryProfiler()
@@ -0,0 +1,79 @@
+"""
+Single-flight coalescing of identical reads.
+Concurrent calls with the same key share one computation, and its result is reused for `ttl` seconds.
+Keys are scoped to a guild so that a write can invalidate everything read from that guild's data.
+"""
+import asyncio
+import time
+import typing as tp
+
+import src.metrics as metrics
+
+DEFAULT_TTL = 5.0  # seconds a result is reused for
+
+
+class SingleFlight:
+    """
+    Shares in-flight computations and keeps their results for a short time, per (guild, key).
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        """
+        Args: seconds a result is reused for
+        Return value: None
+        """
+        self.ttl = ttl
+        self.inflight = {}  # dict: {guild_id: {key: asyncio.Task}}
+        self.results = {}  # dict: {guild_id: {key: (expiry, result)}}
+
+    async def do(self, guild_id: int, key: tp.Hashable, compute: tp.Callable[[], tp.Awaitable[tp.Any]]) -> tp.Any:
+        """
+        Get a result computed by a call of `compute`: a fresh cached one, the one being computed right now,
+        or a new one. Exceptions reach every caller sharing the computation and are not cached.
+        Args: guild id, key (e.g. the command name and its arguments), coroutine function computing the result
+        Return value: the result
+        """
+        cached = self.results.get(guild_id, {}).get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            metrics.increment("singleflight.hits")
+            return cached[1]
+        task = self.inflight.get(guild_id, {}).get(key)
+        if task is not None:
+            metrics.increment("singleflight.coalesced")
+        else:
+            metrics.increment("singleflight.misses")
+            task = asyncio.ensure_future(compute())
+            self.inflight.setdefault(guild_id, {})[key] = task
+            task.add_done_callback(lambda done: self._finished(guild_id, key, done))
+        return await asyncio.shield(task)  # a caller giving up does not cancel the others' result
+
+    def _finished(self, guild_id: int, key: tp.Hashable, task: asyncio.Task) -> None:
+        """
+        Cache a finished computation's result, unless it was invalidated while running.
+        """
+        inflight = self.inflight.get(guild_id, {})
+        if inflight.get(key) is not task:
+            return  # invalidated, a newer computation may be running
+        del inflight[key]
+        if not inflight:
+            del self.inflight[guild_id]
+        if task.cancelled() or task.exception() is not None:
+            return
+        now = time.monotonic()
+        results = self.results.setdefault(guild_id, {})
+        for i in [i for i, (expiry, _) in results.items() if expiry <= now]:
+            del results[i]  # drop what expired meanwhile, so old keys don't pile up
+        results[key] = (now + self.ttl, task.result())
+
+    def invalidate(self, guild_id: int, key: tp.Optional[tp.Hashable] = None) -> None:
+        """
+        Forget cached results after a write, and stop sharing computations that started before it.
+        Args: guild id, key to forget (everything of the guild by default)
+        Return value: None
+        """
+        if key is None:
+            self.results.pop(guild_id, None)
+            self.inflight.pop(guild_id, None)
+            return
+        self.results.get(guild_id, {}).pop(key, None)
+        self.inflight.get(guild_id, {}).pop(key, None)
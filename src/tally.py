@@ -0,0 +1,158 @@
+"""
+Batch tally engine for recounts and strategy simulations.
+Ballot rows are turned into columns (voter, candidate index, role, weight) once, then weights are resolved,
+totals summed and winners picked for any number of winners_pool/votes_cutoff settings with NumPy,
+instead of looping over the ballots one by one. The live vote path keeps its incremental tally and Leaderboard;
+this is for looking at a whole election at once.
+"""
+import typing as tp
+
+import numpy as np
+
+
+class Ballots:
+    """
+    An election's ballots as columns, one row per (voter, candidate) vote.
+    """
+
+    def __init__(self, candidates: tp.List[str], voters, choices, roles, weights):
+        """
+        Args: candidate ids in the election's order, then arrays of equal length:
+        voter ids, candidate positions in `candidates`, role ids the votes were cast with, their weights
+        Return value: None
+        """
+        self.candidates = candidates
+        self.voters = np.asarray(voters, dtype=np.int64)
+        self.choices = np.asarray(choices, dtype=np.intp)
+        self.roles = np.asarray(roles, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.choices)
+
+    @classmethod
+    def from_rows(cls, candidates: tp.List[str], rows: tp.List[tp.Tuple[int, int, int, int]]) -> "Ballots":
+        """
+        Build the columns from ballot rows, as returned by db.election_ballots.
+        Ballots for candidates no longer in the election are left out.
+        Args: candidate ids in the election's order, [(voter_id, candidate_id, weight, role_id)]
+        Return value: Ballots
+        """
+        if not rows or not candidates:
+            return cls(candidates, [], [], [], [])
+        table = np.array(rows, dtype=np.int64)
+        known = np.array(candidates, dtype=np.int64)
+        order = np.argsort(known)
+        found = np.searchsorted(known, table[:, 1], sorter=order).clip(max=len(known) - 1)
+        choices = order[found]
+        valid = known[choices] == table[:, 1]
+        return cls(candidates, table[valid, 0], choices[valid], table[valid, 3], table[valid, 2])
+
+    def resolve(self, role_weights: tp.Optional[dict] = None) -> np.ndarray:
+        """
+        Get the weight of every vote.
+        Args: {role_id: weight} to weigh votes by the role they were cast with, None for the weights they were cast with
+        Return value: array of weights
+        """
+        if role_weights is None:
+            return self.weights
+        table = sorted((int(role), weight) for role, weight in role_weights.items())
+        if not table:
+            return np.zeros(len(self), dtype=np.int64)
+        role_ids = np.array([i[0] for i in table], dtype=np.int64)
+        weights = np.array([i[1] for i in table] + [0], dtype=np.int64)  # the last one is for unweighted roles
+        found = np.searchsorted(role_ids, self.roles)
+        found[role_ids[found.clip(max=len(role_ids) - 1)] != self.roles] = len(role_ids)
+        return weights[found]
+
+    def totals(self, role_weights: tp.Optional[dict] = None) -> np.ndarray:
+        """
+        Sum the weighted votes of every candidate.
+        Args: see resolve
+        Return value: array of votes, in the order of `candidates`
+        """
+        weights = self.resolve(role_weights)
+        return np.bincount(self.choices, weights=weights, minlength=len(self.candidates)).astype(np.int64)
+
+    def voter_count(self) -> int:
+        """
+        Count the distinct voters.
+        """
+        return len(np.unique(self.voters))
+
+
+def stored_totals(election) -> np.ndarray:
+    """
+    Get an election's incrementally kept tally as an array.
+    Args: election
+    Return value: array of votes, in the order of its candidates_votes
+    """
+    return np.fromiter((votes for _, votes in election.candidates_votes.values()), dtype=np.int64)
+
+
+class Outcomes:
+    """
+    Winners of one tally under any number of settings, from a single ranking of the candidates.
+    Ties keep the candidates' order, like the Leaderboard does.
+    """
+
+    def __init__(self, totals: np.ndarray):
+        """
+        Args: array of votes per candidate
+        Return value: None
+        """
+        self.totals = np.asarray(totals, dtype=np.int64)
+        self.order = np.argsort(-self.totals, kind="stable")  # candidate positions, most votes first
+        self.ranked = self.totals[self.order]
+
+    def pools(self, winners_pools) -> np.ndarray:
+        """
+        Count the winners of the max_votes strategy for each pool size.
+        Args: iterable of winners_pool values
+        Return value: array of winner counts
+        """
+        return np.minimum(np.asarray(winners_pools, dtype=np.int64), len(self.totals))
+
+    def cutoffs(self, votes_cutoffs) -> np.ndarray:
+        """
+        Count the winners of the cutoff strategy for each cutoff, with one binary search each.
+        Args: iterable of votes_cutoff values
+        Return value: array of winner counts
+        """
+        return np.searchsorted(-self.ranked, -np.asarray(votes_cutoffs, dtype=np.int64), side="right")
+
+    def count(self, strategy: str, winners_pool: int, votes_cutoff: int) -> int:
+        """
+        Count the winners under some settings. max_votes without a pool falls back to the cutoff, as in Leaderboard.winners.
+        Args: winner_selection_strategy, winners_pool, votes_cutoff
+        Return value: number of winners
+        """
+        if strategy == "max_votes" and winners_pool:
+            return int(self.pools([winners_pool])[0])
+        return int(self.cutoffs([votes_cutoff])[0])
+
+    def quartiles(self) -> tp.List[int]:
+        """
+        Get the votes of the candidates at the tally's quartiles, rounded up, as cutoffs worth trying.
+        Args: None
+        Return value: list of votes
+        """
+        if not len(self.totals):
+            return []
+        return [int(i) for i in np.ceil(np.percentile(self.totals, [25, 50, 75]))]
+
+    def winners(self, count: int) -> np.ndarray:
+        """
+        Get the positions of the leading candidates.
+        Args: number of winners
+        Return value: array of candidate positions, most votes first
+        """
+        return self.order[:count]
+
+    def tied_at_edge(self, count: int) -> bool:
+        """
+        Check whether the last winner has as many votes as the first candidate left out.
+        Args: number of winners
+        Return value: bool
+        """
+        return 0 < count < len(self.ranked) and self.ranked[count - 1] == self.ranked[count]
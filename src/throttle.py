@@ -0,0 +1,188 @@
+"""
+Throttling of reaction and button votes.
+Every (guild, voter) pair gets a token bucket. Reaction events are only accumulated in memory;
+a voter's pending changes are written out one window after their first event, and only
+if their bucket has a token left, otherwise once it refills. Flips in the meantime
+(add, remove, add, ...) collapse into their net change, so spamming a reaction costs
+CPU cycles instead of database writes.
+"""
+import asyncio
+import time
+import typing as tp
+
+import src.log as log
+import src.metrics as metrics
+
+BUCKET_CAPACITY = 3  # writes a voter can burst
+BUCKET_RATE = 0.5  # writes per second a voter gets back
+FLUSH_WINDOW = 1.0  # seconds to wait for more events before writing a voter's changes
+SWEEP_EVERY = 10000  # events between cleanups of idle buckets
+FLUSH_TASK = "listener:reaction-vote"  # task name the watchdog reports stalls of vote writes under
+logger = log.get_logger("votes")
+
+
+class TokenBucket:
+    """
+    A classic token bucket.
+    """
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float):
+        """
+        Args: maximum tokens, tokens regained per second
+        Return value: None
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self) -> bool:
+        """
+        Take a token if there is one.
+        Args: None
+        Return value: whether a token was taken
+        """
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """
+        Seconds until the next token is available.
+        Args: None
+        Return value: seconds of type float
+        """
+        self._refill(time.monotonic())
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def is_full(self) -> bool:
+        """
+        Whether the bucket has refilled completely, i.e. the voter has been idle.
+        """
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class ReactionThrottle:
+    """
+    Per-(guild, voter) token buckets with flip collapsing.
+    """
+
+    def __init__(
+        self,
+        apply: tp.Callable[[int, int, int, int, int], tp.Awaitable[None]],
+        capacity: float = BUCKET_CAPACITY,
+        rate: float = BUCKET_RATE,
+        window: float = FLUSH_WINDOW,
+    ):
+        """
+        Args: coroutine function applying a net change as apply(guild_id, voter_id, message_id, emoji_id, delta),
+        bucket capacity, bucket refill rate, collapsing window in seconds
+        Return value: None
+        """
+        self.apply = apply
+        self.capacity = capacity
+        self.rate = rate
+        self.window = window
+        self.buckets = {}  # dict: {(guild_id, voter_id): TokenBucket}
+        self.pending = {}  # dict: {(guild_id, voter_id): {(message_id, emoji_id): net delta}}
+        self.timers = {}  # dict: {(guild_id, voter_id): asyncio.TimerHandle}
+        self._events = 0
+
+    def submit(self, guild_id: int, voter_id: int, message_id: int, emoji_id: int, delta: int) -> None:
+        """
+        Record a reaction being added (delta=1) or removed (delta=-1). Does no I/O.
+        Args: guild id, voter id, message id, emoji id, delta
+        Return value: None
+        """
+        metrics.increment("reactions.received")
+        key = (guild_id, voter_id)
+        changes = self.pending.setdefault(key, {})
+        vote = (message_id, emoji_id)
+        net = changes.get(vote, 0) + delta
+        if net:
+            changes[vote] = net
+        else:
+            del changes[vote]
+            metrics.increment("reactions.collapsed")
+        if key not in self.timers:
+            self.timers[key] = asyncio.get_running_loop().call_later(self.window, self._due, key)
+        self._events += 1
+        if self._events % SWEEP_EVERY == 0:
+            self._sweep()
+
+    def allow(self, guild_id: int, voter_id: int) -> bool:
+        """
+        Take a token for a vote that is applied right away (a button click) instead of being collapsed.
+        Shares the voter's bucket with their reactions.
+        Args: guild id, voter id
+        Return value: whether the vote may be applied
+        """
+        key = (guild_id, voter_id)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.capacity, self.rate)
+        return bucket.consume()
+
+    def _due(self, key: tp.Tuple[int, int]) -> None:
+        """
+        A voter's window is over: write their changes if the bucket allows, otherwise try again later.
+        """
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.capacity, self.rate)
+        if not self.pending.get(key):
+            self.timers.pop(key, None)
+            self.pending.pop(key, None)
+            return
+        if not bucket.consume():
+            metrics.increment("reactions.throttled")
+            self.timers[key] = asyncio.get_running_loop().call_later(bucket.wait_time(), self._due, key)
+            return
+        del self.timers[key]
+        asyncio.create_task(self._flush(key, self.pending.pop(key)), name=FLUSH_TASK)
+
+    async def _flush(self, key: tp.Tuple[int, int], changes: tp.Dict[tp.Tuple[int, int], int]) -> None:
+        """
+        Apply a voter's net changes.
+        """
+        guild_id, voter_id = key
+        for (message_id, emoji_id), delta in changes.items():
+            try:
+                await self.apply(guild_id, voter_id, message_id, emoji_id, delta)
+            except Exception:
+                metrics.increment("reactions.failed")
+                logger.exception(
+                    "Failed to apply a vote", extra=log.fields(guild_id=guild_id, voter_id=voter_id, message_id=message_id)
+                )
+            else:
+                metrics.increment("reactions.applied")
+
+    def flush_all(self) -> None:
+        """
+        Write out every pending change right away, ignoring the buckets. Used on cog unload.
+        Args: None
+        Return value: None
+        """
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        for key, changes in self.pending.items():
+            if changes:
+                asyncio.create_task(self._flush(key, changes), name=FLUSH_TASK)
+        self.pending.clear()
+
+    def _sweep(self) -> None:
+        """
+        Forget buckets of voters that have been idle long enough to refill completely.
+        """
+        for key in [k for k, b in self.buckets.items() if k not in self.timers and b.is_full()]:
+            del self.buckets[key]
@@ -0,0 +1,144 @@
+"""
+Event loop lag watchdog.
+A heartbeat task on the loop measures how late its sleeps wake up (the loop's lag). A background thread
+notices when the heartbeat stops for longer than the threshold and, while the loop is still stuck,
+records the loop thread's stack and the name of the task running on it. Commands rename their task
+to "command:<name>" (see internals.label_command); listeners run in discord.py's "discord.py: <event>" tasks,
+and the votes they hand off in "listener:reaction-vote" and "listener:button-vote" tasks.
+Stalls are counted per task name; tasks left with asyncio's "Task-<n>" names share UNNAMED_TASK.
+
+Configured with LOOP_LAG_THRESHOLD_MS (250 by default).
+"""
+import asyncio
+import collections
+import datetime
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+
+import src.log as log
+import src.metrics as metrics
+
+HEARTBEAT_INTERVAL = 0.1  # seconds between heartbeats
+THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")) / 1000  # seconds of lag that count as a stall
+STACK_FRAMES = 15  # innermost frames kept per stall
+STALLS_KEPT = 20  # most recent stalls kept for `ping` and `view-stalls`
+UNNAMED_TASK = "unnamed"  # metric key for tasks nobody named, so that keys don't grow with every task
+_DEFAULT_TASK_NAME = re.compile(r"Task-\d+")
+logger = log.get_logger("watchdog")
+
+
+class LoopWatchdog:
+    """
+    Measures the event loop's lag and records what was running when it stalled.
+    """
+
+    def __init__(self, threshold: float = THRESHOLD, interval: float = HEARTBEAT_INTERVAL):
+        """
+        Args: seconds of lag that count as a stall, seconds between heartbeats
+        Return value: None
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = 0.0  # lag of the last heartbeat, seconds
+        self.max_lag = 0.0
+        self.stalls = collections.deque(maxlen=STALLS_KEPT)  # of dicts: {"at", "lag", "task", "stack"}
+        self.last_beat = None  # monotonic time of the last heartbeat
+        self._capture = None  # (heartbeat the stall followed, task name, stack), written by the thread
+        self._loop = None
+        self._loop_thread = None
+        self._heartbeat = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the watchdog has been started.
+        """
+        return self._thread is not None
+
+    def start(self) -> None:
+        """
+        Start watching the running loop. Must be called from the loop's thread.
+        Args: None
+        Return value: None
+        """
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat = self._loop.create_task(self._beat(), name="watchdog-heartbeat")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop watching.
+        Args: None
+        Return value: None
+        """
+        if not self.running:
+            return
+        self._stop.set()
+        self._heartbeat.cancel()
+        self._thread.join()
+        self._thread = None
+
+    async def _beat(self) -> None:
+        """
+        Heartbeat task: sleeps for `interval` and records how late it woke up.
+        """
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            previous, self.last_beat = self.last_beat, now
+            self._record(max(0.0, now - expected), previous)
+
+    def _record(self, lag: float, previous_beat: float) -> None:
+        """
+        Account for one heartbeat's lag, and report it if it was a stall.
+        """
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        metrics.gauge("watchdog.lag_ms", round(lag * 1000))
+        metrics.gauge("watchdog.max_lag_ms", round(self.max_lag * 1000))
+        if lag < self.threshold:
+            return
+        capture, self._capture = self._capture, None
+        task, stack = ("unknown", []) if capture is None or capture[0] != previous_beat else capture[1:]
+        stall = {"at": datetime.datetime.now() - datetime.timedelta(seconds=lag), "lag": lag, "task": task, "stack": stack}
+        self.stalls.append(stall)
+        metrics.increment("watchdog.stalls")
+        metrics.increment(f"watchdog.stalls.{UNNAMED_TASK if _DEFAULT_TASK_NAME.fullmatch(task) else task}")
+        logger.warning(
+            "Event loop stalled",
+            extra=log.fields(lag_ms=round(lag * 1000), task=task, stack="".join(stack)),
+        )
+
+    def _watch(self) -> None:
+        """
+        Watchdog thread body: captures the loop thread's stack once per stall, while it is stuck.
+        """
+        while not self._stop.wait(self.threshold / 5):
+            beat = self.last_beat
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            if self._capture is not None and self._capture[0] == beat:
+                continue  # this stall is already captured
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                return  # the loop thread is gone
+            task = asyncio.current_task(self._loop)
+            name = task.get_name() if task is not None else "callback"  # a plain callback, no task
+            self._capture = (beat, name, traceback.format_stack(frame, limit=STACK_FRAMES))
+            del frame  # don't keep the loop thread's locals alive
+
+
+monitor = LoopWatchdog()  # started in ElectionsBot.setup_hook